@@ -1,16 +1,23 @@
-from rag_module.main import process_query, agent_orchestrator
-from flask import Flask, request, jsonify
+from rag_module.main import (
+    process_query, agent_orchestrator, stream_query, warm_up, lookup_answer, get_answer_cache,
+    refresh_index, component_status
+)
+from rag_module.redis_store import RedisStore, get_redis, hashed_key
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 import logging
-import asyncio
-import redis
 import json
 import os
 import sys
 import subprocess
 import requests
+from functools import partial
 from dotenv import load_dotenv
 from flask_login import login_required
+from async_runner import AsyncRunner
+from jobs import JobQueue, QueueFull
+from pr_coalescer import PullRequestCoalescer
+from health import HealthProbe
 
 # Add the parent directory to Python path using absolute path
 current_dir = os.path.dirname(os.path.abspath(__file__))
@@ -28,18 +35,12 @@ logging.basicConfig(level=logging.INFO)
 app = Flask(__name__)
 CORS(app)
 
-# Initialize Redis cache with environment variables
-REDIS_HOST = os.getenv('REDIS_HOST', 'localhost')
-REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
-REDIS_DB = int(os.getenv('REDIS_DB', 0))
+# Redis connections come from the pool shared with rag_module (REDIS_URL or
+# REDIS_HOST/REDIS_PORT/REDIS_DB); cached values go through the compact store
 CACHE_EXPIRATION = 3600  # Cache expiration in seconds (1 hour)
 
-cache = redis.Redis(
-    host=REDIS_HOST,
-    port=REDIS_PORT,
-    db=REDIS_DB,
-    decode_responses=True
-)
+cache = get_redis(decode_responses=True)
+store = RedisStore()
 
 # Server configuration
 HOST = os.getenv('HOST', '0.0.0.0')
@@ -48,6 +49,45 @@ N8N_HOST = os.getenv('N8N_HOST', 'localhost')
 N8N_PORT = int(os.getenv('N8N_PORT', 5678))
 N8N_PROTOCOL = os.getenv('N8N_PROTOCOL', 'http')
 N8N_AUTH_TOKEN = os.getenv('N8N_AUTH_TOKEN')
+ASYNC_TIMEOUT = float(os.getenv('ASYNC_TIMEOUT', '300'))
+RAG_WARMUP = os.getenv('RAG_WARMUP', 'true').lower() == 'true'
+RAG_WARMUP_LLM = os.getenv('RAG_WARMUP_LLM', 'true').lower() == 'true'
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', 2))
+JOB_MAX_PENDING = int(os.getenv('JOB_MAX_PENDING', 100))
+JOB_TTL = int(os.getenv('JOB_TTL', 3600))
+JOB_MAX_WAIT = float(os.getenv('JOB_MAX_WAIT', 25))
+WEBHOOK_WORKERS = int(os.getenv('WEBHOOK_WORKERS', 2))
+WEBHOOK_MAX_PENDING = int(os.getenv('WEBHOOK_MAX_PENDING', 500))
+WEBHOOK_DEDUP_TTL = int(os.getenv('WEBHOOK_DEDUP_TTL', 86400))
+GITHUB_ACCESS_TOKEN = os.getenv('GITHUB_ACCESS_TOKEN')
+PR_DEBOUNCE_SECONDS = float(os.getenv('PR_DEBOUNCE_SECONDS', 30))
+PR_SUPERSEDE_POLL = float(os.getenv('PR_SUPERSEDE_POLL', 2))
+HEALTH_PROBE_INTERVAL = float(os.getenv('HEALTH_PROBE_INTERVAL', 15))
+HEALTH_PROBE_TIMEOUT = float(os.getenv('HEALTH_PROBE_TIMEOUT', 3))
+# Components that must pass for /health/ready; the others are only reported
+HEALTH_READY_REQUIRES = [
+    name.strip() for name in os.getenv('HEALTH_READY_REQUIRES', 'redis,model,index').split(',')
+    if name.strip()
+]
+
+# One event loop shared by every request handled by this worker
+runner = AsyncRunner()
+
+
+def run_async(coro):
+    """Run a coroutine on the shared event loop from a Flask handler"""
+    return runner.run(coro, timeout=ASYNC_TIMEOUT)
+
+
+# Models and indexes load on first use unless warm-up is requested; it runs
+# in the background so the server answers immediately either way
+def _log_warm_up(future):
+    if not future.cancelled() and future.exception() is not None:
+        logging.error("RAG warm-up failed", exc_info=future.exception())
+
+
+if RAG_WARMUP:
+    runner.submit(warm_up(load_llm=RAG_WARMUP_LLM)).add_done_callback(_log_warm_up)
 
 
 @app.route('/api/execute', methods=['POST'])
@@ -56,66 +96,166 @@ def execute_command():
     command = data.get('command', '')
 
     # Check cache first
-    cache_key = f"cmd:{command}"
-    cached_result = cache.get(cache_key)
+    cache_key = hashed_key("cmd", command)
+    cached_result = store.get(cache_key)
     if cached_result:
         logging.info(f"Cache hit for command: {command}")
-        return jsonify(json.loads(cached_result))
+        return jsonify(cached_result)
 
     logging.info(f"Received command: {command}")
     # Simulated execution (in a real system, this would control Cursor AI)
     result = f"Simulated execution of command: {command}"
 
     # Cache the result
-    cache.setex(cache_key, CACHE_EXPIRATION, json.dumps({'result': result}))
+    store.set(cache_key, {'result': result}, ttl=CACHE_EXPIRATION)
     return jsonify({'result': result})
 
 
+def rag_job(payload):
+    """Run a RAG query (process_query caches the answer)"""
+    return run_async(process_query(payload['query'], plan_mode=payload.get('plan')))
+
+
+def orchestrate_job(payload):
+    """Build a plan for a task and cache it"""
+    task_description = payload['task']
+    plan = run_async(agent_orchestrator(task_description))
+    store.set(hashed_key("task", task_description), plan, ttl=CACHE_EXPIRATION)
+    return plan
+
+
+def refresh_job(payload):
+    """Pull the repositories and re-index; stale cached answers are dropped"""
+    return {"index_version": run_async(refresh_index())}
+
+
+jobs = JobQueue(
+    cache,
+    handlers={'rag': rag_job, 'orchestrate': orchestrate_job, 'refresh': refresh_job},
+    workers=JOB_WORKERS,
+    max_pending=JOB_MAX_PENDING,
+    ttl=JOB_TTL
+)
+jobs.start()
+
+
+def wants_async(data):
+    """Whether the client asked for a job id instead of waiting for the result"""
+    return bool(data.get('async')) or request.args.get('async') in ('1', 'true')
+
+
+def submit_job(kind, payload):
+    """Queue a job and answer 202 with where to poll for it"""
+    try:
+        job_id = jobs.submit(kind, payload)
+    except QueueFull as e:
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '5'}
+    return jsonify({
+        "job_id": job_id,
+        "status": "queued",
+        "status_url": f"/api/jobs/{job_id}"
+    }), 202, {'Location': f"/api/jobs/{job_id}"}
+
+
 @app.route('/api/rag', methods=['POST'])
 def run_rag():
     data = request.get_json()
     query = data.get('query', '')
 
-    # Check cache first
-    cache_key = f"rag:{query}"
-    cached_result = cache.get(cache_key)
+    # "plan": "wait" | "background" | "skip" (see process_query)
+    payload = {'query': query, 'plan': data.get('plan')}
+
+    # Answer from the cache before queueing any work, if the plan is cached too
+    cached_result = run_async(lookup_answer(query, plan_mode=payload['plan']))
     if cached_result:
-        logging.info(f"Cache hit for RAG query: {query}")
-        return jsonify(json.loads(cached_result))
+        return jsonify(cached_result)
+    if wants_async(data):
+        return submit_job('rag', payload)
 
     logging.info(f"Received RAG query: {query}")
     try:
-        result = asyncio.run(process_query(query))
-        # Cache the result
-        cache.setex(cache_key, CACHE_EXPIRATION, json.dumps(result))
-        return jsonify(result)
+        return jsonify(rag_job(payload))
     except Exception as e:
         logging.exception("Error processing RAG query")
         return jsonify({"error": str(e)}), 500
 
 
+def sse(event):
+    return f"data: {json.dumps(event)}\n\n"
+
+
+@app.route('/api/rag/stream', methods=['POST'])
+def stream_rag():
+    """Server-sent events: retrieved sources first, then answer tokens"""
+    data = request.get_json()
+    query = data.get('query', '')
+
+    # Streamed answers carry no plan
+    cached_result = run_async(lookup_answer(query, plan_mode='skip'))
+
+    def generate():
+        if cached_result:
+            yield sse({"type": "sources", "sources": [
+                {"content": content} for content in cached_result.get('source_documents', [])
+            ]})
+            yield sse({"type": "token", "text": cached_result.get('answer', '')})
+            yield sse({"type": "done", **cached_result})
+            return
+
+        logging.info(f"Streaming RAG query: {query}")
+        for event in runner.iterate(stream_query(query), timeout=ASYNC_TIMEOUT):
+            yield sse(event)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+
+@app.route('/api/index/refresh', methods=['POST'])
+def refresh():
+    """Re-index changed repository files in the background"""
+    return submit_job('refresh', {})
+
+
+@app.route('/api/cache/stats', methods=['GET'])
+def cache_stats():
+    """Answer cache hit/miss counters of this worker process"""
+    return jsonify({"pid": os.getpid(), **get_answer_cache().stats()})
+
+
 @app.route('/api/orchestrate', methods=['POST'])
 def orchestrate():
     data = request.get_json()
     task_description = data.get('task', '')
 
     # Check cache first
-    cache_key = f"task:{task_description}"
-    cached_result = cache.get(cache_key)
+    cached_result = store.get(hashed_key("task", task_description))
     if cached_result:
         logging.info(f"Cache hit for task: {task_description}")
-        return jsonify(json.loads(cached_result))
+        return jsonify(cached_result)
+
+    if wants_async(data):
+        return submit_job('orchestrate', {'task': task_description})
 
     logging.info(f"Received orchestration task: {task_description}")
     try:
-        plan = asyncio.run(agent_orchestrator(task_description))
-        # Cache the result
-        cache.setex(cache_key, CACHE_EXPIRATION, json.dumps(plan))
-        return jsonify(plan)
+        return jsonify(orchestrate_job({'task': task_description}))
     except Exception as e:
         logging.exception("Error in orchestration")
         return jsonify({"error": str(e)}), 500
 
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a job; ?wait=N long-polls for up to N seconds"""
+    wait = min(float(request.args.get('wait', 0)), JOB_MAX_WAIT)
+    job = jobs.wait(job_id, timeout=wait)
+    if job is None:
+        return jsonify({"error": f"Unknown job {job_id}"}), 404
+    return jsonify(job)
+
 # New endpoint: Git Pull
 
 
@@ -208,32 +348,80 @@ def run_docker_compose():
         return jsonify({'error': str(e)}), 500
 
 
-@app.route('/health', methods=['GET'])
-def health_check():
-    """Health check endpoint for Docker."""
-    try:
-        # Check Redis connection
-        redis_status = cache.ping()
+def check_redis():
+    return {'ok': bool(cache.ping())}
 
-        # Check RAG module by making a simple query
-        rag_status = asyncio.run(process_query("test"))
 
-        # Check n8n availability
-        n8n_url = f"{N8N_PROTOCOL}://{N8N_HOST}:{N8N_PORT}/healthz"
-        n8n_status = requests.get(n8n_url, timeout=5).status_code == 200
+def check_n8n():
+    n8n_url = f"{N8N_PROTOCOL}://{N8N_HOST}:{N8N_PORT}/healthz"
+    status_code = requests.get(n8n_url, timeout=HEALTH_PROBE_TIMEOUT).status_code
+    return {'ok': status_code == 200, 'status_code': status_code}
+
+
+def check_model():
+    """The LLM is loaded, or is loaded on first use and hasn't failed yet;
+    with a shared model server, that server must answer too"""
+    status = component_status()
+    lazy = not (RAG_WARMUP and RAG_WARMUP_LLM)
+    result = {
+        'ok': status['llm_error'] is None and (status['llm_loaded'] or lazy),
+        'loaded': status['llm_loaded'],
+        'lazy': lazy,
+        'error': status['llm_error']
+    }
+    if status['model_server']:
+        response = requests.get(f"{status['model_server']}/health",
+                                timeout=HEALTH_PROBE_TIMEOUT)
+        result['model_server'] = response.status_code == 200
+        result['ok'] = result['ok'] and result['model_server']
+    return result
+
+
+def check_index():
+    """The index is open, or is opened on first use and hasn't failed yet"""
+    status = component_status()
+    lazy = not RAG_WARMUP
+    return {
+        'ok': status['index_error'] is None and (status['vector_store_loaded'] or lazy),
+        'index_version': status['index_version'],
+        'vector_store_loaded': status['vector_store_loaded'],
+        'pipeline_ready': status['pipeline_ready'],
+        'lazy': lazy,
+        'error': status['index_error']
+    }
 
-        return jsonify({
-            'status': 'healthy',
-            'redis': bool(redis_status),
-            'rag_module': 'error' not in rag_status,
-            'n8n': n8n_status
-        })
-    except Exception as e:
-        logging.exception("Health check failed")
-        return jsonify({
-            'status': 'unhealthy',
-            'error': str(e)
-        }), 500
+
+# Dependencies are checked in the background; health endpoints only read
+# the cached results, so Docker's probes never run a query or block on I/O
+health_probe = HealthProbe(
+    {'redis': check_redis, 'n8n': check_n8n, 'model': check_model, 'index': check_index},
+    required=HEALTH_READY_REQUIRES,
+    interval=HEALTH_PROBE_INTERVAL,
+    timeout=HEALTH_PROBE_TIMEOUT
+)
+health_probe.start()
+
+
+@app.route('/health/live', methods=['GET'])
+def liveness():
+    """The process is serving and its background threads are running"""
+    alive = runner.is_alive() and health_probe.is_alive()
+    return jsonify({'status': 'alive' if alive else 'dead'}), 200 if alive else 503
+
+
+@app.route('/health/ready', methods=['GET'])
+def readiness():
+    """Every required component passed the latest background probe"""
+    snapshot = health_probe.snapshot()
+    return jsonify(snapshot), 200 if snapshot['ready'] else 503
+
+
+@app.route('/health', methods=['GET'])
+def health_check():
+    """Cached status of every component; always 200 while the process is alive"""
+    snapshot = health_probe.snapshot()
+    snapshot['status'] = 'healthy' if snapshot['ready'] else 'degraded'
+    return jsonify(snapshot)
 
 
 @app.route('/api/webhook', methods=['POST'])
@@ -267,88 +455,73 @@ def github_webhook():
     data = request.get_json()
     if not data:
         return jsonify({"error": "No data provided"}), 400
-        
+
+    if event_type == 'ping':
+        return jsonify({"message": "Webhook configured successfully!"}), 200
+    if event_type not in WEBHOOK_HANDLERS:
+        return jsonify({"message": f"Event type {event_type} not handled"}), 200
+
+    # GitHub redelivers on timeouts; only the first delivery is processed
+    delivery_id = request.headers.get('X-GitHub-Delivery')
+    if delivery_id:
+        dedup_key = f"webhook:delivery:{delivery_id}"
+        if not cache.set(dedup_key, 1, nx=True, ex=WEBHOOK_DEDUP_TTL):
+            logging.info(f"Ignoring duplicate webhook delivery {delivery_id}")
+            return jsonify({"message": "Duplicate delivery ignored"}), 200
+
+    # A burst of pushes to one PR is analysed once: the newest head SHA is
+    # recorded now and each event runs after the debounce delay, returning
+    # at once if it has been superseded by then
+    delay = 0
+    if event_type == 'pull_request' and pr_coalescer.debounces(data):
+        pr_coalescer.record(data)
+        delay = pr_coalescer.debounce_seconds
+
+    # Persist the event and acknowledge; analysis happens on the worker pool
     try:
-        # Process different event types
-        if event_type == 'pull_request':
-            return handle_pull_request(data)
-        elif event_type == 'push':
-            return handle_push(data)
-        elif event_type == 'issues':
-            return handle_issue(data)
-        elif event_type == 'issue_comment':
-            return handle_comment(data)
-        elif event_type == 'pull_request_review':
-            return handle_review(data)
-        elif event_type == 'ping':
-            return jsonify({"message": "Webhook configured successfully!"}), 200
-        else:
-            return jsonify({"message": f"Event type {event_type} not handled"}), 200
-            
-    except Exception as e:
-        logging.exception(f"Error processing webhook: {str(e)}")
-        return jsonify({"error": str(e)}), 500
+        job_id = webhook_jobs.submit(
+            'webhook',
+            {"event": event_type, "delivery": delivery_id, "data": data},
+            job_id=delivery_id,
+            delay=delay
+        )
+    except QueueFull as e:
+        if delivery_id:
+            # Let GitHub's redelivery through once we have room again
+            cache.delete(dedup_key)
+        return jsonify({"error": str(e)}), 503, {'Retry-After': '30'}
+
+    return jsonify({
+        "message": f"{event_type} event accepted",
+        "job_id": job_id,
+        "status_url": f"/api/jobs/{job_id}"
+    }), 202
 
 def handle_pull_request(data):
     """Handle pull request events"""
     action = data.get('action')
-    pr = data.get('pull_request', {})
     
-    if action == 'opened' or action == 'synchronize':
-        # Analyze PR using RAG
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            query = f"Analyze PR: {pr.get('title')}\n\nDescription: {pr.get('body')}"
-            result = loop.run_until_complete(process_query(query))
-            
-            # Post comment with analysis
-            comment = f"## PR Analysis\n\n{result.get('answer', 'No analysis available')}"
-            if result.get('source_documents'):
-                comment += "\n\n### References\n" + "\n".join(result['source_documents'])
-                
-            headers = {
-                "Accept": "application/vnd.github.v3+json",
-                "Authorization": f"Bearer {GITHUB_ACCESS_TOKEN}"
-            }
-            
-            response = requests.post(
-                pr['comments_url'],
-                headers=headers,
-                json={"body": comment}
-            )
-            response.raise_for_status()
-            
-            return jsonify({
-                "message": "PR analyzed and comment posted",
-                "analysis": result
-            }), 200
-            
-        finally:
-            loop.close()
+    if pr_coalescer.debounces(data):
+        # Scheduled after the debounce delay; superseded events return at once
+        return run_async(pr_coalescer.handle(data))
     
-    return jsonify({"message": f"PR action {action} processed"}), 200
+    return {"message": f"PR action {action} processed"}
 
 def handle_push(data):
     """Handle push events"""
     commits = data.get('commits', [])
     if not commits:
-        return jsonify({"message": "No commits to analyze"}), 200
+        return {"message": "No commits to analyze"}
         
     # Analyze commits using RAG
     commit_messages = "\n".join(f"- {commit['message']}" for commit in commits)
     
-    loop = asyncio.new_event_loop()
-    asyncio.set_event_loop(loop)
-    try:
-        query = f"Analyze commits:\n{commit_messages}"
-        result = loop.run_until_complete(process_query(query))
-        return jsonify({
-            "message": "Push event analyzed",
-            "analysis": result
-        }), 200
-    finally:
-        loop.close()
+    query = f"Analyze commits:\n{commit_messages}"
+    result = run_async(process_query(query, plan_mode='skip'))
+    return {
+        "message": "Push event analyzed",
+        "analysis": result
+    }
 
 def handle_issue(data):
     """Handle issue events"""
@@ -357,38 +530,32 @@ def handle_issue(data):
     
     if action == 'opened':
         # Analyze issue using RAG
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            query = f"Analyze issue: {issue.get('title')}\n\nDescription: {issue.get('body')}"
-            result = loop.run_until_complete(process_query(query))
-            
-            # Post comment with analysis
-            comment = f"## Issue Analysis\n\n{result.get('answer', 'No analysis available')}"
-            if result.get('source_documents'):
-                comment += "\n\n### References\n" + "\n".join(result['source_documents'])
-                
-            headers = {
-                "Accept": "application/vnd.github.v3+json",
-                "Authorization": f"Bearer {GITHUB_ACCESS_TOKEN}"
-            }
-            
-            response = requests.post(
-                issue['comments_url'],
-                headers=headers,
-                json={"body": comment}
-            )
-            response.raise_for_status()
-            
-            return jsonify({
-                "message": "Issue analyzed and comment posted",
-                "analysis": result
-            }), 200
+        query = f"Analyze issue: {issue.get('title')}\n\nDescription: {issue.get('body')}"
+        result = run_async(process_query(query, plan_mode='skip'))
+        
+        # Post comment with analysis
+        comment = f"## Issue Analysis\n\n{result.get('answer', 'No analysis available')}"
+        if result.get('source_documents'):
+            comment += "\n\n### References\n" + "\n".join(result['source_documents'])
             
-        finally:
-            loop.close()
+        headers = {
+            "Accept": "application/vnd.github.v3+json",
+            "Authorization": f"Bearer {GITHUB_ACCESS_TOKEN}"
+        }
+        
+        response = requests.post(
+            issue['comments_url'],
+            headers=headers,
+            json={"body": comment}
+        )
+        response.raise_for_status()
+        
+        return {
+            "message": "Issue analyzed and comment posted",
+            "analysis": result
+        }
     
-    return jsonify({"message": f"Issue action {action} processed"}), 200
+    return {"message": f"Issue action {action} processed"}
 
 def handle_comment(data):
     """Handle issue and PR comments"""
@@ -397,19 +564,14 @@ def handle_comment(data):
     
     if action == 'created':
         # Analyze comment using RAG
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            query = f"Analyze comment: {comment.get('body')}"
-            result = loop.run_until_complete(process_query(query))
-            return jsonify({
-                "message": "Comment analyzed",
-                "analysis": result
-            }), 200
-        finally:
-            loop.close()
+        query = f"Analyze comment: {comment.get('body')}"
+        result = run_async(process_query(query, plan_mode='skip'))
+        return {
+            "message": "Comment analyzed",
+            "analysis": result
+        }
     
-    return jsonify({"message": f"Comment action {action} processed"}), 200
+    return {"message": f"Comment action {action} processed"}
 
 def handle_review(data):
     """Handle pull request reviews"""
@@ -418,19 +580,48 @@ def handle_review(data):
     
     if action == 'submitted':
         # Analyze review using RAG
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            query = f"Analyze review: {review.get('body')}"
-            result = loop.run_until_complete(process_query(query))
-            return jsonify({
-                "message": "Review analyzed",
-                "analysis": result
-            }), 200
-        finally:
-            loop.close()
+        query = f"Analyze review: {review.get('body')}"
+        result = run_async(process_query(query, plan_mode='skip'))
+        return {
+            "message": "Review analyzed",
+            "analysis": result
+        }
     
-    return jsonify({"message": f"Review action {action} processed"}), 200
+    return {"message": f"Review action {action} processed"}
+
+
+WEBHOOK_HANDLERS = {
+    'pull_request': handle_pull_request,
+    'push': handle_push,
+    'issues': handle_issue,
+    'issue_comment': handle_comment,
+    'pull_request_review': handle_review
+}
+
+
+def webhook_job(payload):
+    """Process a persisted GitHub event on the webhook worker pool"""
+    return WEBHOOK_HANDLERS[payload['event']](payload['data'])
+
+
+pr_coalescer = PullRequestCoalescer(
+    cache,
+    analyze=partial(process_query, plan_mode='skip'),
+    github_token=GITHUB_ACCESS_TOKEN,
+    debounce_seconds=PR_DEBOUNCE_SECONDS,
+    poll_interval=PR_SUPERSEDE_POLL
+)
+
+webhook_jobs = JobQueue(
+    cache,
+    handlers={'webhook': webhook_job},
+    queue_name='jobs:webhooks',
+    workers=WEBHOOK_WORKERS,
+    max_pending=WEBHOOK_MAX_PENDING,
+    ttl=JOB_TTL
+)
+webhook_jobs.start()
+
 
 @app.errorhandler(Exception)
 def handle_error(error):
@@ -444,4 +635,5 @@ def handle_error(error):
 
 if __name__ == '__main__':
     # The backend runs on port 8081
-    app.run(host=HOST, port=PORT)
+    # Handler threads block on futures while the shared loop multiplexes them
+    app.run(host=HOST, port=PORT, threaded=True)
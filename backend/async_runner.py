@@ -0,0 +1,82 @@
+import asyncio
+import concurrent.futures
+import logging
+import queue
+import threading
+from typing import Any, AsyncIterator, Coroutine, Iterator, Optional
+
+
+class AsyncRunner:
+    """A single long-lived event loop running on a daemon thread
+
+    Flask handlers run in worker threads; instead of creating (and tearing
+    down) an event loop per request they submit coroutines here, so every
+    in-flight RAG query shares one loop and the connection pools inside
+    aiohttp and LangChain survive between requests.
+    """
+
+    def __init__(self, name: str = "rag-event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """Schedule a coroutine on the loop and return a thread-safe future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and block the calling thread for its result"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            logging.error(f"Coroutine timed out after {timeout}s")
+            raise
+
+    def iterate(self, agen: AsyncIterator[Any],
+                timeout: Optional[float] = None) -> Iterator[Any]:
+        """Consume an async generator on the loop from a synchronous thread
+
+        Items are handed over through a queue as they are produced, so a
+        streaming Flask response can forward them immediately. ``timeout``
+        bounds the wait for each item, not the whole stream.
+        """
+        items: "queue.Queue" = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for item in agen:
+                    items.put(item)
+            finally:
+                items.put(done)
+
+        future = self.submit(pump())
+        try:
+            while True:
+                try:
+                    item = items.get(timeout=timeout)
+                except queue.Empty:
+                    logging.error(f"Stream stalled for {timeout}s")
+                    raise concurrent.futures.TimeoutError()
+                if item is done:
+                    break
+                yield item
+            # Surface exceptions raised inside the generator
+            future.result()
+        finally:
+            # Client went away or the stream stalled: stop producing
+            future.cancel()
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive() and self.loop.is_running()
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
@@ -0,0 +1,123 @@
+import concurrent.futures
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+class HealthProbe:
+    """Check dependencies on a daemon thread and cache the results
+
+    Every ``interval`` seconds each check runs concurrently and is given
+    ``timeout`` seconds; a check that raises, returns something without a
+    truthy ``ok`` or overruns is reported as failing, and a check still
+    stuck from an earlier round is not started again. Health endpoints
+    only read the cached snapshot, so probing them costs nothing and never
+    waits on a slow dependency.
+    """
+
+    def __init__(
+        self,
+        checks: Dict[str, Callable[[], Dict[str, Any]]],
+        required: Iterable[str] = (),
+        interval: float = 15,
+        timeout: float = 3
+    ):
+        self.checks = checks
+        self.required = [name for name in required if name in checks]
+        self.interval = interval
+        self.timeout = timeout
+        # Results older than this mean the probe itself has stopped
+        self.max_age = 3 * interval + timeout
+        self._status: Dict[str, Dict[str, Any]] = {}
+        self._checked_at: Optional[float] = None
+        self._pending: Dict[str, concurrent.futures.Future] = {}
+        self._lock = threading.Lock()
+        self._stopped = threading.Event()
+        self._executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max(len(checks), 1), thread_name_prefix="health-check")
+        self._thread = threading.Thread(
+            target=self._run, name="health-probe", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        logging.info(
+            f"Health probe checking {', '.join(self.checks)} every {self.interval}s")
+
+    def stop(self):
+        self._stopped.set()
+        self._thread.join()
+        self._executor.shutdown(wait=False)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            try:
+                self.probe()
+            except RuntimeError:
+                # Check errors stay in their futures; this is submit() after
+                # the executor was shut down at interpreter exit
+                return
+            except Exception:
+                logging.exception("Health probe round failed")
+            self._stopped.wait(self.interval)
+
+    def _timed(self, check: Callable[[], Dict[str, Any]]) -> Dict[str, Any]:
+        started = time.perf_counter()
+        result = dict(check())
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return result
+
+    def probe(self) -> Dict[str, Dict[str, Any]]:
+        """Run every check once and cache the results"""
+        for name, check in self.checks.items():
+            pending = self._pending.get(name)
+            if pending is None or pending.done():
+                self._pending[name] = self._executor.submit(self._timed, check)
+
+        deadline = time.monotonic() + self.timeout
+        status = {}
+        for name, future in self._pending.items():
+            try:
+                result = future.result(max(deadline - time.monotonic(), 0))
+                result["ok"] = bool(result.get("ok"))
+            except concurrent.futures.TimeoutError:
+                result = {"ok": False, "error": f"timed out after {self.timeout}s"}
+            except Exception as e:
+                result = {"ok": False, "error": str(e)}
+            status[name] = result
+
+        with self._lock:
+            for name, result in status.items():
+                previous = self._status.get(name)
+                if previous is None or previous["ok"] != result["ok"]:
+                    log = logging.info if result["ok"] else logging.warning
+                    log(f"Health check {name}: {'ok' if result['ok'] else result}")
+            self._status = status
+            self._checked_at = time.time()
+        return status
+
+    def age(self) -> Optional[float]:
+        checked_at = self._checked_at
+        return None if checked_at is None else time.time() - checked_at
+
+    def is_alive(self) -> bool:
+        """The probe thread is running and its results are recent"""
+        age = self.age()
+        return self._thread.is_alive() and (age is None or age <= self.max_age)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            status = dict(self._status)
+        age = self.age()
+        ready = (
+            age is not None and age <= self.max_age
+            and all(status.get(name, {}).get("ok") for name in self.required)
+        )
+        return {
+            "status": "ready" if ready else "not_ready",
+            "ready": ready,
+            "checked_at": self._checked_at,
+            "age_seconds": None if age is None else round(age, 3),
+            "required": self.required,
+            "components": status
+        }
@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+
+class QueueFull(Exception):
+    """Raised when the job queue already holds the maximum number of jobs"""
+
+
+class JobQueue:
+    """Redis-backed job queue drained by worker threads in each backend process
+
+    Jobs are hashes at ``job:<id>`` and their ids are pushed onto a Redis
+    list. Every worker process pops from the same list at its own pace, so
+    a burst of submissions queues up instead of tying up HTTP connections,
+    and submissions are refused once ``max_pending`` jobs are waiting.
+
+    Workers take jobs with ``BLMOVE`` into their own processing list and
+    remove them only when finished. Each process refreshes a heartbeat key;
+    when one disappears (the process died mid-job) any live process moves
+    that worker's jobs back onto the queue, failing a job after
+    ``max_attempts`` tries.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        handlers: Dict[str, Callable[[Dict[str, Any]], Any]],
+        queue_name: str = "jobs:queue",
+        workers: int = 2,
+        max_pending: int = 100,
+        ttl: int = 3600,
+        heartbeat_ttl: int = 60,
+        max_attempts: int = 3
+    ):
+        self.redis = redis_client
+        self.handlers = handlers
+        self.queue_name = queue_name
+        self.workers = workers
+        self.max_pending = max_pending
+        self.ttl = ttl
+        self.heartbeat_ttl = heartbeat_ttl
+        self.max_attempts = max_attempts
+        self.process_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self._threads = []
+
+    def _processing_list(self, process_id: str, worker: int) -> str:
+        return f"{self.queue_name}:processing:{process_id}:{worker}"
+
+    @property
+    def _delayed(self) -> str:
+        return f"{self.queue_name}:delayed"
+
+    def _heartbeat_key(self, process_id: str) -> str:
+        return f"{self.queue_name}:alive:{process_id}"
+
+    @staticmethod
+    def _key(job_id: str) -> str:
+        return f"job:{job_id}"
+
+    def submit(self, kind: str, payload: Dict[str, Any],
+               job_id: Optional[str] = None, delay: float = 0) -> str:
+        """Persist a job and enqueue it, returning its id
+
+        With ``delay`` the job is held in a sorted set and queued once that
+        many seconds have passed, so no worker sits waiting on it.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        pending = self.redis.llen(self.queue_name) + self.redis.zcard(self._delayed)
+        if pending >= self.max_pending:
+            raise QueueFull(f"{self.max_pending} jobs already pending")
+
+        job_id = job_id or uuid.uuid4().hex
+        key = self._key(job_id)
+        pipe = self.redis.pipeline()
+        pipe.hset(key, mapping={
+            "id": job_id,
+            "kind": kind,
+            "status": "scheduled" if delay > 0 else "queued",
+            "payload": json.dumps(payload),
+            "created_at": time.time()
+        })
+        pipe.expire(key, self.ttl)
+        if delay > 0:
+            pipe.zadd(self._delayed, {job_id: time.time() + delay})
+        else:
+            pipe.lpush(self.queue_name, job_id)
+        pipe.execute()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.redis.hgetall(self._key(job_id))
+        if not job:
+            return None
+        job.pop("payload", None)
+        if "result" in job:
+            job["result"] = json.loads(job["result"])
+        return job
+
+    def wait(self, job_id: str, timeout: float = 0,
+             interval: float = 0.25) -> Optional[Dict[str, Any]]:
+        """Long-poll until the job finishes or ``timeout`` seconds pass"""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or job["status"] in ("done", "failed"):
+                return job
+            if time.monotonic() >= deadline:
+                return job
+            time.sleep(interval)
+
+    def start(self):
+        self._heartbeat()
+        for i in range(self.workers):
+            self.redis.sadd(f"{self.queue_name}:processing",
+                            self._processing_list(self.process_id, i))
+            thread = threading.Thread(
+                target=self._work, args=(i,), name=f"{self.queue_name}-worker-{i}",
+                daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        thread = threading.Thread(
+            target=self._maintain, name=f"{self.queue_name}-maintenance", daemon=True)
+        thread.start()
+        self._threads.append(thread)
+
+    def _work(self, worker: int):
+        processing = self._processing_list(self.process_id, worker)
+        while True:
+            try:
+                job_id = self.redis.blmove(
+                    self.queue_name, processing, 5, src="RIGHT", dest="LEFT")
+            except Exception as e:
+                logging.error(f"Error reading job queue: {e}")
+                time.sleep(1)
+                continue
+            if job_id:
+                self._process(job_id)
+                try:
+                    self.redis.lrem(processing, 1, job_id)
+                except Exception as e:
+                    logging.error(f"Error acknowledging job {job_id}: {e}")
+
+    def _heartbeat(self):
+        self.redis.set(self._heartbeat_key(self.process_id), 1, ex=self.heartbeat_ttl)
+
+    def _maintain(self):
+        """Queue due delayed jobs, keep this process's heartbeat alive and
+        requeue dead workers' jobs"""
+        interval = self.heartbeat_ttl / 3
+        next_heartbeat = 0
+        while True:
+            try:
+                self._promote_due()
+                if time.monotonic() >= next_heartbeat:
+                    self._heartbeat()
+                    self._reap()
+                    next_heartbeat = time.monotonic() + interval
+            except Exception as e:
+                logging.error(f"Error maintaining job queue: {e}")
+            time.sleep(1)
+
+    def _promote_due(self):
+        for job_id in self.redis.zrangebyscore(self._delayed, 0, time.time()):
+            # Only the process whose ZREM succeeds queues the job
+            if self.redis.zrem(self._delayed, job_id):
+                pipe = self.redis.pipeline()
+                pipe.hset(self._key(job_id), "status", "queued")
+                pipe.lpush(self.queue_name, job_id)
+                pipe.execute()
+
+    def _reap(self):
+        registry = f"{self.queue_name}:processing"
+        prefix = f"{registry}:"
+        for processing in self.redis.smembers(registry):
+            process_id = processing[len(prefix):].rsplit(":", 1)[0]
+            if self.redis.exists(self._heartbeat_key(process_id)):
+                continue
+            while True:
+                job_id = self.redis.lmove(processing, self.queue_name, "RIGHT", "RIGHT")
+                if job_id is None:
+                    break
+                self._requeue(job_id)
+            self.redis.srem(registry, processing)
+
+    def _requeue(self, job_id: str):
+        key = self._key(job_id)
+        if not self.redis.exists(key):
+            self.redis.lrem(self.queue_name, 1, job_id)
+            return
+        attempts = self.redis.hincrby(key, "attempts", 1)
+        if attempts >= self.max_attempts:
+            logging.error(f"Job {job_id} abandoned by {attempts} workers, giving up")
+            self.redis.lrem(self.queue_name, 1, job_id)
+            self.redis.hset(key, mapping={
+                "status": "failed",
+                "result": json.dumps({"error": "worker died while running the job"}),
+                "finished_at": time.time()
+            })
+        else:
+            logging.warning(f"Requeued job {job_id} abandoned by a dead worker")
+            self.redis.hset(key, "status", "queued")
+        self.redis.expire(key, self.ttl)
+
+    def _process(self, job_id: str):
+        key = self._key(job_id)
+        job = self.redis.hgetall(key)
+        if not job:
+            logging.warning(f"Job {job_id} expired before it was processed")
+            return
+
+        self.redis.hset(key, mapping={
+            "status": "running",
+            "started_at": time.time()
+        })
+        try:
+            result = self.handlers[job["kind"]](json.loads(job["payload"]))
+            status = "done"
+        except Exception as e:
+            logging.exception(f"Job {job_id} failed")
+            result = {"error": str(e)}
+            status = "failed"
+
+        self.redis.hset(key, mapping={
+            "status": status,
+            "result": json.dumps(result),
+            "finished_at": time.time()
+        })
+        self.redis.expire(key, self.ttl)
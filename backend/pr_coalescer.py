@@ -0,0 +1,135 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+import requests
+
+
+class Superseded(Exception):
+    """Raised when a newer head SHA arrives for the pull request being analysed"""
+
+
+class PullRequestCoalescer:
+    """Debounce pull request analysis and keep a single comment per PR
+
+    Every ``opened``/``synchronize`` event is ``record``-ed as the PR's
+    latest head SHA in Redis when the webhook arrives, and the caller
+    schedules its analysis ``debounce_seconds`` later. When that job runs,
+    ``handle`` returns at once if a newer SHA has arrived meanwhile;
+    otherwise the analysis is cancelled as soon as a newer SHA shows up (in
+    any worker process), and its result edits the PR's existing analysis
+    comment instead of posting a new one.
+    """
+
+    def __init__(
+        self,
+        redis_client,
+        analyze: Callable[[str], Awaitable[Dict[str, Any]]],
+        github_token: Optional[str],
+        debounce_seconds: float = 30,
+        poll_interval: float = 2,
+        ttl: int = 86400
+    ):
+        self.redis = redis_client
+        self.analyze = analyze
+        self.github_token = github_token
+        self.debounce_seconds = debounce_seconds
+        self.poll_interval = poll_interval
+        self.ttl = ttl
+
+    @staticmethod
+    def debounces(data: Dict[str, Any]) -> bool:
+        """Whether this pull_request event triggers a (debounced) analysis"""
+        return data.get('action') in ('opened', 'synchronize')
+
+    @staticmethod
+    def pr_key(data: Dict[str, Any]) -> str:
+        repo = data.get('repository', {}).get('full_name', '')
+        return f"{repo}#{data['pull_request']['number']}"
+
+    def _latest_sha(self, pr_key: str) -> Optional[str]:
+        return self.redis.get(f"pr:latest:{pr_key}")
+
+    def _check(self, pr_key: str, head_sha: str):
+        latest = self._latest_sha(pr_key)
+        if latest is not None and latest != head_sha:
+            raise Superseded(latest)
+
+    async def _acheck(self, pr_key: str, head_sha: str):
+        """``_check`` off the event loop, which other queries share"""
+        await asyncio.get_running_loop().run_in_executor(
+            None, self._check, pr_key, head_sha)
+
+    def record(self, data: Dict[str, Any]):
+        """Mark this event's head SHA as the PR's latest; call on receipt"""
+        head_sha = data['pull_request'].get('head', {}).get('sha', '')
+        self.redis.set(f"pr:latest:{self.pr_key(data)}", head_sha, ex=self.ttl)
+
+    async def handle(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Analyse a recorded event once its debounce delay has passed"""
+        pr = data['pull_request']
+        pr_key = self.pr_key(data)
+        head_sha = pr.get('head', {}).get('sha', '')
+
+        try:
+            await self._acheck(pr_key, head_sha)
+            result = await self._analyze_unless_superseded(pr, pr_key, head_sha)
+            await self._acheck(pr_key, head_sha)
+        except Superseded as e:
+            logging.info(f"Skipping analysis of {pr_key}@{head_sha}: superseded by {e}")
+            return {"message": f"PR analysis superseded by {e}"}
+
+        comment_url = await asyncio.get_running_loop().run_in_executor(
+            None, self._upsert_comment, pr, pr_key, self._format(result, head_sha))
+        return {
+            "message": "PR analyzed and comment updated",
+            "comment_url": comment_url,
+            "head_sha": head_sha,
+            "analysis": result
+        }
+
+    async def _analyze_unless_superseded(self, pr: Dict[str, Any], pr_key: str,
+                                         head_sha: str) -> Dict[str, Any]:
+        query = f"Analyze PR: {pr.get('title')}\n\nDescription: {pr.get('body')}"
+        task = asyncio.ensure_future(self.analyze(query))
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=self.poll_interval)
+            if done:
+                return task.result()
+            try:
+                await self._acheck(pr_key, head_sha)
+            except Superseded:
+                task.cancel()
+                raise
+
+    @staticmethod
+    def _format(result: Dict[str, Any], head_sha: str) -> str:
+        comment = f"## PR Analysis\n\n{result.get('answer', 'No analysis available')}"
+        if result.get('source_documents'):
+            comment += "\n\n### References\n" + "\n".join(result['source_documents'])
+        comment += f"\n\n_Analysed at {head_sha[:7]}_"
+        return comment
+
+    def _upsert_comment(self, pr: Dict[str, Any], pr_key: str, body: str) -> str:
+        """Edit the PR's analysis comment in place, creating it the first time"""
+        headers = {
+            "Accept": "application/vnd.github.v3+json",
+            "Authorization": f"Bearer {self.github_token}"
+        }
+        comment_key = f"pr:comment:{pr_key}"
+        comment_url = self.redis.get(comment_key)
+        if comment_url:
+            response = requests.patch(
+                comment_url, headers=headers, json={"body": body})
+            if response.status_code != 404:
+                response.raise_for_status()
+                return comment_url
+
+        response = requests.post(
+            pr['comments_url'],
+            headers=headers,
+            json={"body": body}
+        )
+        response.raise_for_status()
+        comment_url = response.json()['url']
+        self.redis.set(comment_key, comment_url)
+        return comment_url
@@ -30,6 +30,12 @@ class AgentOrchestrator:
         if self.verbose:
             logging.info(f"Registered agent: {name}")
     
+    async def warm_up(self):
+        """Build what agents would otherwise build during their first task"""
+        for agent in self.agents.values():
+            if hasattr(agent, "warm_up"):
+                await agent.warm_up()
+
     async def run_agent(self, agent_name: str, task: str) -> Dict[str, Any]:
         """Run a specific agent on a task"""
         if agent_name not in self.agents:
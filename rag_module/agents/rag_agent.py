@@ -1,14 +1,20 @@
 from typing import Dict, List, Any
 import json
+import asyncio
+import logging
 from langchain.prompts import PromptTemplate
+from langchain_core.documents import Document
 from .base_agent import BaseAgent
-from ..main import build_vector_store, build_llama_index
+from ..main import (
+    get_query_pipeline, build_llama_index, RETRIEVER_K, FUSION_CANDIDATES, RETRIEVAL_TIMEOUT
+)
+from ..pipeline import reciprocal_rank_fusion
 
 class RAGAgent(BaseAgent):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.vector_store = None
-        self.llama_index = None
+        self.pipeline = None
+        self.index_retriever = None
         
     def get_prompt(self) -> PromptTemplate:
         return PromptTemplate(
@@ -40,21 +46,34 @@ Response:"""
             "4. Cache results for future use"
         ]
     
+    async def warm_up(self):
+        """Open the retrieval sources; cheap once the stores are built"""
+        # Shared pipeline for the current index version (rebuilt only when it changes)
+        self.pipeline = await get_query_pipeline()
+        if self.index_retriever is None:
+            llama_index = await build_llama_index()
+            if llama_index is not None:
+                # Retrieve only: the LLM call of a query engine would be discarded
+                self.index_retriever = llama_index.as_retriever(
+                    similarity_top_k=FUSION_CANDIDATES)
+
     async def execute(self, task: str) -> Dict[str, Any]:
         self._increment_step()  # Step 1
+        await self.warm_up()
         
-        # Initialize stores if not already done
-        if not self.vector_store:
-            self.vector_store = await build_vector_store()
-        if not self.llama_index:
-            self.llama_index = await build_llama_index()
-        
-        # Step 2: Retrieve context
+        # Step 2: Retrieve context from every source at once
         self._increment_step()
-        vector_results = await self._get_vector_results(task)
-        index_results = await self._get_index_results(task)
+        vector_results, sparse_results = await asyncio.gather(
+            self._retrieve("vector_store", self._get_vector_results(task)),
+            self._retrieve("bm25", self._get_sparse_results(task))
+        )
+        # LlamaIndex reads the same Chroma collection as the vector store, so
+        # it only stands in for dense retrieval when that failed
+        index_results = []
+        if not vector_results:
+            index_results = await self._retrieve("llama_index", self._get_index_results(task))
         
-        combined_context = self._merge_results(vector_results, index_results)
+        combined_context = self._merge_results(vector_results, sparse_results, index_results)
         
         # Step 3: Generate response
         self._increment_step()
@@ -72,36 +91,50 @@ Response:"""
             "response": chain_response,
             "sources": {
                 "vector_store": [str(doc) for doc in vector_results],
+                "bm25": [str(doc) for doc in sparse_results],
                 "llama_index": [str(doc) for doc in index_results]
             }
         }
     
+    async def _retrieve(self, source: str, results) -> List[Any]:
+        """Await one source's results, giving up on it after RETRIEVAL_TIMEOUT"""
+        try:
+            return await asyncio.wait_for(results, RETRIEVAL_TIMEOUT)
+        except asyncio.TimeoutError:
+            logging.warning(f"{source} retrieval timed out; continuing without it")
+        except Exception as e:
+            logging.error(f"{source} retrieval failed; continuing without it: {e}")
+        return []
+
     async def _get_vector_results(self, query: str) -> List[Any]:
         """Get results from vector store"""
-        retriever = self.vector_store.as_retriever(search_kwargs={"k": 3})
-        docs = await retriever.aget_relevant_documents(query)
-        return docs
+        return await self.pipeline.retrieve(query, k=FUSION_CANDIDATES)
+
+    async def _get_sparse_results(self, query: str) -> List[Any]:
+        """Get keyword (BM25) results, which catch exact identifiers"""
+        return await self.pipeline.retrieve_sparse(query, k=FUSION_CANDIDATES)
     
     async def _get_index_results(self, query: str) -> List[Any]:
         """Get results from LlamaIndex"""
-        query_engine = self.llama_index.as_query_engine()
-        response = await query_engine.aquery(query)
-        return response.source_nodes
+        if self.index_retriever is None:
+            return []
+        return await self.index_retriever.aretrieve(query)
         
-    def _merge_results(self, vector_results: List[Any], index_results: List[Any]) -> Dict[str, Any]:
-        """Merge and deduplicate results from different sources"""
-        merged = {
-            "vector_store_results": [
-                {
-                    "content": doc.page_content,
-                    "metadata": doc.metadata
-                } for doc in vector_results
-            ],
-            "llama_index_results": [
-                {
-                    "content": node.node.text,
-                    "metadata": node.node.metadata
-                } for node in index_results
+    def _merge_results(self, vector_results: List[Any], sparse_results: List[Any],
+                       index_results: List[Any]) -> Dict[str, Any]:
+        """Fuse the dense and BM25 rankings with reciprocal rank fusion
+
+        Dense hits are ranked once, from the vector store or (as a fallback)
+        LlamaIndex, never both: they search the same collection.
+        """
+        dense_source, dense_results = "vector_store", vector_results
+        if not vector_results:
+            dense_source, dense_results = "llama_index", [
+                Document(page_content=node.node.text, metadata=node.node.metadata)
+                for node in index_results
             ]
-        }
-        return merged 
\ No newline at end of file
+        fused = reciprocal_rank_fusion({
+            dense_source: dense_results,
+            "bm25": sparse_results
+        }, limit=RETRIEVER_K)
+        return {"results": fused}
@@ -0,0 +1,210 @@
+import time
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+from .redis_store import RedisStore, hashed_key
+
+
+# Stat counted for a request answered by each tier (None is a miss)
+_TIER_STATS = {"l1": "l1_exact_hits", "l1_semantic": "l1_semantic_hits",
+               "l2": "l2_hits", None: "misses"}
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.lower().split())
+
+
+class AnswerCache:
+    """Two-tier cache of RAG answers
+
+    L1 lives in the process: an LRU of recent answers keyed by normalized
+    query, plus a matrix of their query embeddings so near-duplicate
+    questions (cosine similarity >= ``similarity_threshold``) hit too.
+    The matrix is bounded by ``l1_size`` and searched by brute force,
+    which is a single matrix-vector product at that size. L2 is Redis,
+    shared by every worker and keyed by a hash of the normalized query
+    under ``rag:``. Redis here has no vector search, so near-duplicate
+    matching happens in L1 only.
+
+    Each answer records the ``chunk_ids`` it was generated from, and
+    ``chunkdeps:{chunk_id}`` sets map chunks back to the answer keys that
+    cited them, so re-indexing drops only the answers whose sources
+    changed. Other workers' L1 copies age out within ``l1_ttl``.
+
+    Methods block on Redis and on the embedding model; call them from
+    coroutines through an executor.
+    """
+
+    def __init__(self, redis_store: RedisStore, embeddings, ttl: int = 3600,
+                 l1_size: int = 1024, l1_ttl: float = 300,
+                 similarity_threshold: float = 0.9, namespace: str = "rag"):
+        self.redis_store = redis_store
+        self.embeddings = embeddings
+        self.ttl = ttl
+        self.l1_size = l1_size
+        self.l1_ttl = l1_ttl
+        self.similarity_threshold = similarity_threshold
+        self.namespace = namespace
+
+        # normalized query -> [result, expires_at, matrix row]
+        self._entries: "OrderedDict[str, list]" = OrderedDict()
+        self._vectors: Optional[np.ndarray] = None
+        self._row_keys: list = []
+        self._lock = threading.Lock()
+        self._stats = {"l1_exact_hits": 0, "l1_semantic_hits": 0,
+                       "l2_hits": 0, "misses": 0, "invalidated": 0}
+
+    def _embed(self, query: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(query), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def record(self, cache: Optional[str]):
+        """Count a request answered by tier ``cache`` (None for a miss)
+
+        For callers that look up with ``count=False`` and only know later
+        whether the request was served from the cache.
+        """
+        with self._lock:
+            self._stats[_TIER_STATS[cache]] += 1
+
+    def lookup(self, query: str, count: bool = True) -> Optional[Dict[str, Any]]:
+        """Return the cached result for this (or a near-identical) query
+
+        The returned dict carries ``cache`` naming the tier that answered.
+        Pass ``count=False`` for repeat lookups within one request (polls,
+        pre-checks) so hit/miss stats stay per request.
+        """
+        return self.lookup_with(query, (), count)[0]
+
+    def lookup_with(self, query: str, keys: Sequence[str],
+                    count: bool = True) -> Tuple[Optional[Dict[str, Any]], List[Any]]:
+        """``lookup``, also reading ``keys`` from Redis in the same round trip
+
+        Returns the cached result (or None) and the values of ``keys``.
+        Redis is not touched at all on an L1 hit without ``keys``.
+        """
+        key = normalize_query(query)
+        now = time.monotonic()
+        hit = None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[1] > now:
+                self._entries.move_to_end(key)
+                hit = {**entry[0], "cache": "l1"}
+
+        vector = None
+        if hit is None:
+            vector = self._embed(key)
+            with self._lock:
+                if self._row_keys:
+                    similarities = self._vectors[:len(self._row_keys)] @ vector
+                    best = int(np.argmax(similarities))
+                    entry = self._entries.get(self._row_keys[best])
+                    if (similarities[best] >= self.similarity_threshold
+                            and entry is not None and entry[1] > now):
+                        self._entries.move_to_end(self._row_keys[best])
+                        hit = {**entry[0], "cache": "l1_semantic"}
+
+        # On an L1 hit only ``keys`` are left to read
+        l2_keys = [] if hit is not None else [hashed_key(self.namespace, key)]
+        try:
+            values = self.redis_store.mget([*l2_keys, *keys])
+        except Exception as e:
+            logging.error(f"Answer cache L2 lookup failed: {e}")
+            values = [None] * (len(l2_keys) + len(keys))
+        if hit is None:
+            result, *values = values
+            if result is not None:
+                self._put_local(key, result, vector)
+                hit = {**result, "cache": "l2"}
+
+        if count:
+            self.record(hit and hit["cache"])
+        return hit, values
+
+    def store(self, query: str, result: Dict[str, Any]):
+        """Cache a result, registering it under each of its ``chunk_ids``"""
+        key = normalize_query(query)
+        self._put_local(key, result, self._embed(key))
+        try:
+            self.redis_store.set_indexed(
+                hashed_key(self.namespace, key), result, self.ttl,
+                [f"chunkdeps:{chunk_id}" for chunk_id in result.get("chunk_ids") or []])
+        except Exception as e:
+            logging.error(f"Answer cache L2 store failed: {e}")
+
+    def discard(self, query: str):
+        """Drop the cached answer for exactly this query from both tiers"""
+        key = normalize_query(query)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+        try:
+            self.redis_store.delete(hashed_key(self.namespace, key))
+        except Exception as e:
+            logging.error(f"Answer cache L2 discard failed: {e}")
+
+    def invalidate_chunks(self, chunk_ids: Iterable[str], batch_size: int = 500) -> int:
+        """Drop every cached answer that cited one of these chunks"""
+        chunk_ids = list(chunk_ids)
+        changed = set(chunk_ids)
+        keys = set()
+        for start in range(0, len(chunk_ids), batch_size):
+            dep_keys = [f"chunkdeps:{chunk_id}"
+                        for chunk_id in chunk_ids[start:start + batch_size]]
+            for members in self.redis_store.members_many(dep_keys):
+                keys.update(members)
+            self.redis_store.delete(*dep_keys)
+        stale_keys = keys
+        keys = list(keys)
+        for start in range(0, len(keys), batch_size):
+            self.redis_store.delete(*keys[start:start + batch_size])
+
+        with self._lock:
+            stale = [
+                key for key, entry in self._entries.items()
+                if hashed_key(self.namespace, key) in stale_keys
+                or changed.intersection(entry[0].get("chunk_ids") or [])
+            ]
+            for key in stale:
+                self._drop(key)
+            self._stats["invalidated"] += len(keys)
+        logging.info(
+            f"Invalidated {len(keys)} cached answers citing {len(chunk_ids)} changed chunks")
+        return len(keys)
+
+    def _put_local(self, key: str, result: Dict[str, Any], vector: np.ndarray):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            while len(self._entries) >= self.l1_size:
+                self._drop(next(iter(self._entries)))
+
+            if self._vectors is None:
+                self._vectors = np.zeros((self.l1_size, len(vector)), dtype=np.float32)
+            row = len(self._row_keys)
+            self._vectors[row] = vector
+            self._row_keys.append(key)
+            self._entries[key] = [result, time.monotonic() + self.l1_ttl, row]
+
+    def _drop(self, key: str):
+        """Remove an L1 entry, moving the last matrix row into its slot"""
+        _, _, row = self._entries.pop(key)
+        last = len(self._row_keys) - 1
+        if row != last:
+            moved = self._row_keys[last]
+            self._vectors[row] = self._vectors[last]
+            self._row_keys[row] = moved
+            self._entries[moved][2] = row
+        self._row_keys.pop()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["l1_entries"] = len(self._entries)
+        lookups = sum(v for k, v in stats.items() if k.endswith("_hits")) + stats["misses"]
+        stats["hit_rate"] = (lookups - stats["misses"]) / lookups if lookups else 0.0
+        return stats
@@ -0,0 +1,195 @@
+import asyncio
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, AsyncIterator, Iterator, List, Optional, Tuple
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import Generation, GenerationChunk, LLMResult
+from pydantic import PrivateAttr
+
+
+def _apply_stop(text: str, stop: Optional[List[str]]) -> str:
+    """Cut generated text at the first stop sequence"""
+    for sequence in stop or []:
+        index = text.find(sequence)
+        if index != -1:
+            text = text[:index]
+    return text
+
+
+class BatchingEngine:
+    """Dynamic batching in front of a transformers text-generation pipeline
+
+    Prompts submitted from any thread or coroutine are queued; a worker
+    thread takes whatever is pending (waiting at most ``max_wait_ms`` for
+    more, up to ``max_batch_size``) and runs it as one padded batch. Each
+    caller's future resolves as soon as the batch holding its prompt is
+    done, and the next batch starts immediately. Streamed generations run
+    outside the batches, at most ``max_streams`` at a time, each pumped by
+    a thread of the engine's own executor.
+    """
+
+    def __init__(self, pipe, max_batch_size: int = 8, max_wait_ms: float = 20,
+                 max_streams: int = 2):
+        self.pipe = pipe
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        # Taken on the event loop before any thread is involved, so queued
+        # streams wait as coroutines instead of occupying executor threads
+        self.stream_slots = asyncio.Semaphore(max_streams)
+        self.stream_executor = ThreadPoolExecutor(
+            max_workers=max_streams, thread_name_prefix="generation-stream")
+
+        # Decoder-only models must be left-padded to batch
+        tokenizer = pipe.tokenizer
+        if tokenizer.pad_token is None:
+            tokenizer.pad_token = tokenizer.eos_token
+        tokenizer.padding_side = "left"
+
+        self._requests: "queue.Queue[Tuple[str, Future]]" = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._run, name="generation-batcher", daemon=True)
+        self._worker.start()
+
+    def submit(self, prompt: str) -> Future:
+        future: Future = Future()
+        self._requests.put((prompt, future))
+        return future
+
+    def stream(self, prompt: str,
+               cancelled: Optional[threading.Event] = None) -> Iterator[str]:
+        """Generate one prompt outside the batches, yielding text as it decodes
+
+        Generation stops at the next token once ``cancelled`` is set.
+        """
+        from transformers import StoppingCriteria, StoppingCriteriaList, TextIteratorStreamer
+
+        class Cancelled(StoppingCriteria):
+            def __call__(self, input_ids, scores, **kwargs) -> bool:
+                return cancelled is not None and cancelled.is_set()
+
+        streamer = TextIteratorStreamer(
+            self.pipe.tokenizer, skip_prompt=True, skip_special_tokens=True)
+        errors = []
+
+        def generate():
+            try:
+                self.pipe(prompt, streamer=streamer, return_full_text=False,
+                          stopping_criteria=StoppingCriteriaList([Cancelled()]))
+            except Exception as e:
+                logging.exception("Error streaming generation")
+                errors.append(e)
+                # Unblock the consumer, which re-raises the error
+                streamer.end()
+
+        thread = threading.Thread(target=generate, daemon=True)
+        thread.start()
+        for text in streamer:
+            if text:
+                yield text
+        thread.join()
+        if errors:
+            raise errors[0]
+
+    def _run(self):
+        while True:
+            try:
+                batch = [self._requests.get()]
+                deadline = time.monotonic() + self.max_wait
+                while len(batch) < self.max_batch_size:
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        break
+                    try:
+                        batch.append(self._requests.get(timeout=timeout))
+                    except queue.Empty:
+                        break
+                # Callers that timed out or went away cancelled their futures;
+                # the rest can no longer be cancelled once marked running
+                batch = [(prompt, future) for prompt, future in batch
+                         if future.set_running_or_notify_cancel()]
+                if batch:
+                    self._process(batch)
+            except Exception:
+                # One bad batch must not take down the only generation thread
+                logging.exception("Generation batcher error")
+
+    def _process(self, batch: List[Tuple[str, Future]]):
+        prompts = [prompt for prompt, _ in batch]
+        try:
+            outputs = self.pipe(
+                prompts, batch_size=len(prompts), return_full_text=False)
+        except Exception as e:
+            logging.exception("Error generating batch")
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), output in zip(batch, outputs):
+            if not future.done():
+                future.set_result(output[0]["generated_text"])
+
+
+class BatchedPipelineLLM(LLM):
+    """LangChain LLM whose calls are merged into batches by a BatchingEngine"""
+
+    _engine: BatchingEngine = PrivateAttr()
+
+    def __init__(self, engine: BatchingEngine, **kwargs: Any):
+        super().__init__(**kwargs)
+        self._engine = engine
+
+    @property
+    def _llm_type(self) -> str:
+        return "batched_huggingface_pipeline"
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Any = None, **kwargs: Any) -> str:
+        return _apply_stop(self._engine.submit(prompt).result(), stop)
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager: Any = None, **kwargs: Any) -> str:
+        text = await asyncio.wrap_future(self._engine.submit(prompt))
+        return _apply_stop(text, stop)
+
+    # Submit every prompt of a multi-prompt call at once so they share batches
+
+    def _generate(self, prompts: List[str], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> LLMResult:
+        futures = [self._engine.submit(prompt) for prompt in prompts]
+        return LLMResult(generations=[
+            [Generation(text=_apply_stop(future.result(), stop))]
+            for future in futures
+        ])
+
+    async def _agenerate(self, prompts: List[str], stop: Optional[List[str]] = None,
+                         run_manager: Any = None, **kwargs: Any) -> LLMResult:
+        texts = await asyncio.gather(*[
+            asyncio.wrap_future(self._engine.submit(prompt)) for prompt in prompts
+        ])
+        return LLMResult(generations=[
+            [Generation(text=_apply_stop(text, stop))] for text in texts
+        ])
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager: Any = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        loop = asyncio.get_running_loop()
+        engine = self._engine
+        async with engine.stream_slots:
+            cancelled = threading.Event()
+            tokens = engine.stream(prompt, cancelled)
+            done = object()
+            try:
+                while True:
+                    text = await loop.run_in_executor(
+                        engine.stream_executor, next, tokens, done)
+                    if text is done:
+                        return
+                    yield GenerationChunk(text=text)
+            finally:
+                # The consumer finished, failed or went away: stop generating
+                cancelled.set()
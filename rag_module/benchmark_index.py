@@ -0,0 +1,114 @@
+"""Measure recall@k and query latency of ANN index settings.
+
+    python -m rag_module.benchmark_index --k 3 \\
+        --factory HNSW32 --factory "HNSW32,SQfp16" --factory "IVF256,PQ32" \\
+        --ef-search 16,32,64,128 --nprobe 4,8,16,32
+
+The corpus is the embeddings of the indexed chunks (served from the
+embedding cache, so nothing is re-encoded). Queries are the lines of
+``--queries-file``, or else a held-out sample of the chunks. Every index
+is compared with exact brute-force search over the same vectors.
+"""
+import argparse
+import time
+from typing import List
+import numpy as np
+import faiss
+from .main import _iter_chunks, iter_source_documents, get_embeddings
+from .vector_stores import build_faiss_index, tune_faiss_index
+
+
+def load_corpus(limit: int) -> np.ndarray:
+    texts = []
+    for chunk in _iter_chunks(iter_source_documents()):
+        texts.append(chunk.page_content)
+        if limit and len(texts) >= limit:
+            break
+    return np.asarray(get_embeddings().embed_documents(texts), dtype=np.float32)
+
+
+def load_queries(path: str) -> np.ndarray:
+    with open(path, 'r', encoding='utf-8') as f:
+        queries = [line.strip() for line in f if line.strip()]
+    embeddings = get_embeddings()
+    return np.asarray([embeddings.embed_query(q) for q in queries], dtype=np.float32)
+
+
+def search_each(index, queries: np.ndarray, k: int):
+    """Search one query at a time, as requests do; returns ids and ms/query"""
+    results = []
+    start = time.perf_counter()
+    for query in queries:
+        _, ids = index.search(query[None, :], k)
+        results.append(ids[0])
+    elapsed = time.perf_counter() - start
+    return np.asarray(results), elapsed * 1000 / len(queries)
+
+
+def recall_at_k(found: np.ndarray, truth: np.ndarray) -> float:
+    k = truth.shape[1]
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found, truth))
+    return hits / (k * len(truth))
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(',') if v]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--factory', action='append',
+                        help="FAISS index-factory string (repeatable)")
+    parser.add_argument('--k', type=int, default=3)
+    parser.add_argument('--ef-search', type=int_list, default=[16, 32, 64, 128])
+    parser.add_argument('--nprobe', type=int_list, default=[1, 4, 16, 64])
+    parser.add_argument('--limit', type=int, default=0,
+                        help="Use at most this many chunks (0: all)")
+    parser.add_argument('--queries', type=int, default=200,
+                        help="Held-out chunks used as queries")
+    parser.add_argument('--queries-file',
+                        help="Text file with one query per line")
+    args = parser.parse_args()
+    factories = args.factory or ["HNSW32", "HNSW32,SQfp16", "IVF256,Flat", "IVF256,PQ32"]
+
+    corpus = load_corpus(args.limit)
+    if args.queries_file:
+        base, queries = corpus, load_queries(args.queries_file)
+    else:
+        rng = np.random.default_rng(0)
+        order = rng.permutation(len(corpus))
+        queries = corpus[order[:args.queries]]
+        base = corpus[order[args.queries:]]
+    dimension = base.shape[1]
+
+    exact = faiss.IndexFlatL2(dimension)
+    exact.add(base)
+    truth, exact_ms = search_each(exact, queries, args.k)
+    print(f"{len(base)} vectors, {len(queries)} queries, dim {dimension}, k={args.k}")
+    print(f"{'index':<22}{'param':<14}{'recall@k':>10}{'ms/query':>10}{'MB':>9}{'build s':>9}")
+    print(f"{'Flat (brute force)':<22}{'-':<14}{1.0:>10.3f}{exact_ms:>10.3f}"
+          f"{base.nbytes / 2**20:>9.1f}{0:>9.1f}")
+
+    for factory in factories:
+        start = time.perf_counter()
+        index = build_faiss_index(dimension, factory, base)
+        index.add(base)
+        build_seconds = time.perf_counter() - start
+        size_mb = faiss.serialize_index(index).nbytes / 2**20
+
+        if hasattr(faiss.downcast_index(index), "hnsw"):
+            grid = [(f"efSearch={ef}", {"ef_search": ef}) for ef in args.ef_search]
+        elif faiss.try_extract_index_ivf(index) is not None:
+            grid = [(f"nprobe={n}", {"nprobe": n}) for n in args.nprobe]
+        else:
+            grid = [("-", {})]
+
+        for label, params in grid:
+            tune_faiss_index(index, **params)
+            found, ms = search_each(index, queries, args.k)
+            print(f"{factory:<22}{label:<14}{recall_at_k(found, truth):>10.3f}"
+                  f"{ms:>10.3f}{size_mb:>9.1f}{build_seconds:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,61 @@
+import bisect
+from typing import Dict, Iterable, Iterator, Tuple
+from langchain.text_splitter import RecursiveCharacterTextSplitter, Language
+from langchain_core.documents import Document
+
+# Split code on function/class boundaries and Markdown on headings
+LANGUAGE_BY_FILE_TYPE = {
+    ".py": Language.PYTHON,
+    ".js": Language.JS,
+    ".ts": Language.TS,
+    ".md": Language.MARKDOWN
+}
+
+_splitters: Dict[Tuple[str, int, int], RecursiveCharacterTextSplitter] = {}
+
+
+def get_splitter(file_type: str, chunk_size: int,
+                 chunk_overlap: int) -> RecursiveCharacterTextSplitter:
+    """Return a (cached) splitter suited to the given file extension"""
+    key = (file_type, chunk_size, chunk_overlap)
+    if key not in _splitters:
+        language = LANGUAGE_BY_FILE_TYPE.get(file_type)
+        if language is not None:
+            splitter = RecursiveCharacterTextSplitter.from_language(
+                language=language,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                add_start_index=True
+            )
+        else:
+            splitter = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                add_start_index=True
+            )
+        _splitters[key] = splitter
+    return _splitters[key]
+
+
+def chunk_documents(docs: Iterable[Document], chunk_size: int,
+                    chunk_overlap: int) -> Iterator[Document]:
+    """Lazily split whole-file documents into line-annotated chunks
+
+    Each chunk keeps the metadata of its file and gains ``chunk_index``,
+    ``start_line`` and ``end_line`` (1-based, inclusive).
+    """
+    for doc in docs:
+        content = doc.page_content
+        splitter = get_splitter(
+            doc.metadata.get("file_type", ""), chunk_size, chunk_overlap)
+        newlines = [i for i, char in enumerate(content) if char == "\n"]
+
+        for index, chunk in enumerate(splitter.split_documents([doc])):
+            start = max(chunk.metadata.pop("start_index", 0), 0)
+            end = start + max(len(chunk.page_content) - 1, 0)
+            chunk.metadata.update({
+                "chunk_index": index,
+                "start_line": bisect.bisect_left(newlines, start) + 1,
+                "end_line": bisect.bisect_left(newlines, end) + 1
+            })
+            yield chunk
@@ -0,0 +1,303 @@
+import os
+import re
+import json
+import asyncio
+import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_community.embeddings import HuggingFaceEmbeddings
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-writer only
+    fcntl = None
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class DiskEmbeddingCache:
+    """Content-addressed embeddings persisted across rebuilds and restarts
+
+    Vectors for one model are appended to ``vectors.f32`` (a raw float32
+    matrix read through ``np.memmap``) and their text hashes to
+    ``index.txt``, one per line, so line ``i`` names row ``i``. Appends
+    are serialised with ``flock`` so several workers can share a directory.
+    """
+
+    def __init__(self, directory: str, model_name: str):
+        self.directory = os.path.join(
+            directory, re.sub(r'[^A-Za-z0-9_.-]', '_', model_name))
+        os.makedirs(self.directory, exist_ok=True)
+        self.vectors_path = os.path.join(self.directory, 'vectors.f32')
+        self.index_path = os.path.join(self.directory, 'index.txt')
+        self.meta_path = os.path.join(self.directory, 'meta.json')
+        self.lock_path = os.path.join(self.directory, '.lock')
+
+        self.dim: Optional[int] = None
+        self._rows: Dict[str, int] = {}
+        self._row_count = 0
+        self._index_offset = 0
+        self._mmap = None
+        self._lock = threading.Lock()
+
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)["dim"]
+        with self._file_lock():
+            self._repair()
+            self._refresh()
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _file_lock(self):
+        lock_file = open(self.lock_path, 'a')
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        return lock_file
+
+    def _repair(self):
+        """Drop rows left half-written by an interrupted append"""
+        if self.dim is None or not os.path.exists(self.index_path):
+            return
+        row_bytes = self.dim * 4
+        vector_bytes = os.path.getsize(self.vectors_path) \
+            if os.path.exists(self.vectors_path) else 0
+        with open(self.index_path, 'r', encoding='ascii') as f:
+            keys = [line for line in f if line.endswith('\n')]
+        rows = min(vector_bytes // row_bytes, len(keys))
+        if rows != len(keys) or rows * row_bytes != vector_bytes:
+            logging.warning(
+                f"Truncating embedding cache {self.directory} to {rows} rows")
+            with open(self.index_path, 'w', encoding='ascii') as f:
+                f.writelines(keys[:rows])
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(rows * row_bytes)
+
+    def _refresh(self):
+        """Pick up rows appended since the last read (possibly by other processes)
+
+        A key written twice maps to its latest row.
+        """
+        if not os.path.exists(self.index_path):
+            return
+        if self.dim is None and os.path.exists(self.meta_path):
+            with open(self.meta_path, 'r', encoding='utf-8') as f:
+                self.dim = json.load(f)["dim"]
+        with open(self.index_path, 'r', encoding='ascii') as f:
+            f.seek(self._index_offset)
+            for line in f:
+                if not line.endswith('\n'):
+                    break
+                self._rows[line.strip()] = self._row_count
+                self._row_count += 1
+                self._index_offset += len(line)
+
+    def _grown(self) -> bool:
+        return os.path.exists(self.index_path) and \
+            os.path.getsize(self.index_path) > self._index_offset
+
+    def _matrix(self) -> np.ndarray:
+        if self._mmap is None or len(self._mmap) < self._row_count:
+            self._mmap = np.memmap(
+                self.vectors_path, dtype=np.float32, mode='r',
+                shape=(self._row_count, self.dim))
+        return self._mmap
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, List[float]]:
+        keys = list(keys)
+        with self._lock:
+            # Other workers may have embedded these since we last looked
+            if any(key not in self._rows for key in keys) and self._grown():
+                self._refresh()
+            found = [(key, self._rows[key]) for key in keys if key in self._rows]
+            if not found:
+                return {}
+            matrix = self._matrix()
+            return {key: matrix[row].tolist() for key, row in found}
+
+    def put_many(self, items: Iterable[Tuple[str, List[float]]]):
+        with self._lock, self._file_lock():
+            self._refresh()
+            new_items = {}
+            for key, vector in items:
+                if key not in self._rows:
+                    new_items[key] = vector
+            if not new_items:
+                return
+
+            vectors = np.asarray(list(new_items.values()), dtype=np.float32)
+            if self.dim is None:
+                self.dim = int(vectors.shape[1])
+                with open(self.meta_path, 'w', encoding='utf-8') as f:
+                    json.dump({"dim": self.dim}, f)
+
+            # Vectors go first. A writer killed mid-append leaves vectors (or a
+            # partial line) past the last indexed row; cut them off so the new
+            # rows land where index.txt says they are
+            with open(self.vectors_path, 'ab') as f:
+                f.truncate(self._row_count * self.dim * 4)
+                f.write(vectors.tobytes())
+            with open(self.index_path, 'a', encoding='ascii') as f:
+                f.truncate(self._index_offset)
+                f.write("".join(f"{key}\n" for key in new_items))
+            self._refresh()
+
+
+class EmbeddingService(Embeddings):
+    """Process-wide embedding model with request batching and an LRU cache
+
+    Concurrent callers (threads or coroutines) are merged into a single
+    forward pass: the batcher thread waits up to ``batch_window_ms`` for
+    more texts, or until ``max_batch_size`` texts are pending.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        device: str = 'cpu',
+        batch_window_ms: float = 5,
+        max_batch_size: int = 64,
+        cache_size: int = 10000,
+        disk_cache: Optional[DiskEmbeddingCache] = None
+    ):
+        self.model_name = model_name
+        self.batch_window = batch_window_ms / 1000
+        self.max_batch_size = max_batch_size
+        self.cache_size = cache_size
+        self.disk_cache = disk_cache
+        self.model = HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={'device': device}
+        )
+
+        self._cache: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+        self._requests: "queue.Queue[Tuple[List[str], Future]]" = queue.Queue()
+        self._worker = threading.Thread(
+            target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+
+    # LRU cache
+
+    def _cache_get(self, key: str) -> Optional[List[float]]:
+        with self._cache_lock:
+            vector = self._cache.get(key)
+            if vector is not None:
+                self._cache.move_to_end(key)
+            return vector
+
+    def _cache_put(self, key: str, vector: List[float]):
+        with self._cache_lock:
+            self._cache[key] = vector
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    # Batching
+
+    def _run(self):
+        while True:
+            requests = [self._requests.get()]
+            pending = len(requests[0][0])
+            deadline = time.monotonic() + self.batch_window
+            while pending < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    request = self._requests.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                requests.append(request)
+                pending += len(request[0])
+            self._process(requests)
+
+    def _process(self, requests: List[Tuple[List[str], Future]]):
+        texts = [text for request_texts, _ in requests for text in request_texts]
+        try:
+            vectors = self.model.embed_documents(texts)
+        except Exception as e:
+            logging.exception("Error computing embeddings")
+            for _, future in requests:
+                future.set_exception(e)
+            return
+
+        offset = 0
+        for request_texts, future in requests:
+            future.set_result(vectors[offset:offset + len(request_texts)])
+            offset += len(request_texts)
+
+    def _submit(self, texts: List[str], persist: bool = True) -> Future:
+        """Resolve cached texts immediately and queue the rest for the batcher
+
+        Only ``persist`` requests (documents) use the disk cache; one-off
+        queries stay in the in-memory LRU instead of growing it forever.
+        """
+        disk_cache = self.disk_cache if persist else None
+        result: Future = Future()
+        keys = [text_hash(text) for text in texts]
+        vectors: Dict[int, List[float]] = {}
+        misses = []
+        for i, key in enumerate(keys):
+            vector = self._cache_get(key)
+            if vector is None:
+                misses.append(i)
+            else:
+                vectors[i] = vector
+
+        if misses and disk_cache is not None:
+            stored = disk_cache.get_many(keys[i] for i in misses)
+            for i in misses:
+                if keys[i] in stored:
+                    vectors[i] = stored[keys[i]]
+                    self._cache_put(keys[i], vectors[i])
+            misses = [i for i in misses if i not in vectors]
+
+        if not misses:
+            result.set_result([vectors[i] for i in range(len(texts))])
+            return result
+
+        def on_done(batch: Future):
+            if batch.exception() is not None:
+                result.set_exception(batch.exception())
+                return
+            for i, vector in zip(misses, batch.result()):
+                vectors[i] = vector
+                self._cache_put(keys[i], vector)
+            if disk_cache is not None:
+                try:
+                    disk_cache.put_many(
+                        (keys[i], vectors[i]) for i in misses)
+                except Exception as e:
+                    logging.error(f"Error writing embedding cache: {e}")
+            result.set_result([vectors[i] for i in range(len(texts))])
+
+        batch: Future = Future()
+        batch.add_done_callback(on_done)
+        self._requests.put(([texts[i] for i in misses], batch))
+        return result
+
+    # langchain Embeddings interface
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._submit(list(texts)).result()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit([text], persist=False).result()[0]
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        return await asyncio.wrap_future(self._submit(list(texts)))
+
+    async def aembed_query(self, text: str) -> List[float]:
+        vectors = await asyncio.wrap_future(self._submit([text], persist=False))
+        return vectors[0]
@@ -0,0 +1,83 @@
+import os
+import logging
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, Optional, Set, Tuple
+from langchain_core.documents import Document
+
+DOCUMENT_EXTENSIONS = {".md", ".txt", ".py", ".js", ".ts"}
+SKIP_DIRS = {
+    ".git", "node_modules", "__pycache__", ".venv", "venv",
+    ".mypy_cache", ".pytest_cache", ".tox", "dist", "build"
+}
+# Bytes inspected when deciding whether a file is binary
+BINARY_SNIFF_BYTES = 8192
+
+# (root directory, base metadata, accepted extensions)
+Source = Tuple[str, Dict[str, Any], Set[str]]
+
+
+def iter_files(root: str, extensions: Set[str]) -> Iterator[str]:
+    """Walk a tree once, pruning vendored/VCS directories"""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in SKIP_DIRS]
+        for name in filenames:
+            if os.path.splitext(name)[1] in extensions:
+                yield os.path.join(dirpath, name)
+
+
+def read_text_file(file_path: str) -> Optional[str]:
+    """Read a UTF-8 text file, returning None for binary or undecodable files"""
+    with open(file_path, 'rb') as f:
+        raw = f.read()
+    if b"\0" in raw[:BINARY_SNIFF_BYTES]:
+        return None
+    try:
+        return raw.decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+def _to_document(file_path: str, metadata: Dict[str, Any],
+                 future) -> Optional[Document]:
+    try:
+        content = future.result()
+    except Exception as e:
+        logging.error(f"Error loading file {file_path}: {str(e)}")
+        return None
+    if content is None:
+        logging.debug(f"Skipping binary file {file_path}")
+        return None
+    return Document(
+        page_content=content,
+        metadata={
+            **metadata,
+            "file_path": file_path,
+            "file_type": os.path.splitext(file_path)[1]
+        }
+    )
+
+
+def iter_documents(sources: Iterable[Source],
+                   max_workers: int = 8) -> Iterator[Document]:
+    """Yield one Document per file while files are read on a thread pool
+
+    Reads are submitted as the walk discovers files and at most
+    ``max_workers * 4`` reads are in flight, so consumers can start
+    embedding long before the walk finishes.
+    """
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for root, metadata, extensions in sources:
+            for file_path in iter_files(root, extensions):
+                pending.append((file_path, metadata,
+                                executor.submit(read_text_file, file_path)))
+                if len(pending) >= max_workers * 4:
+                    doc = _to_document(*pending.popleft())
+                    if doc is not None:
+                        yield doc
+
+        while pending:
+            doc = _to_document(*pending.popleft())
+            if doc is not None:
+                yield doc
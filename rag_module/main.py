@@ -1,22 +1,29 @@
+from __future__ import annotations
+
 import os
 import subprocess
 import logging
 import traceback
 import json
-from typing import List, Dict, Any, Optional
+import hashlib
+import time
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import TYPE_CHECKING, List, Dict, Any, Optional, Iterable, Iterator, AsyncIterator
 from dotenv import load_dotenv
-from langchain_community.llms import HuggingFacePipeline, CTransformers
-from langchain.chains import RetrievalQA
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from llama_index.core import VectorStoreIndex, SimpleDirectoryReader, StorageContext, load_index_from_storage
-from llama_index.core.node_parser import SimpleNodeParser
-from langchain.cache import RedisSemanticCache
-from langchain_core.documents import Document
-from redis import Redis
-from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
-import torch
+from .redis_store import RedisStore, get_redis, hashed_key
+from .single_flight import SingleFlight
+
+# Heavy dependencies (torch, transformers, LangChain, LlamaIndex) are
+# imported on first use so importing this module stays cheap
+if TYPE_CHECKING:
+    from langchain_core.documents import Document
+    from langchain_core.vectorstores import VectorStore
+    from .answer_cache import AnswerCache
+    from .embeddings import EmbeddingService
+    from .pipeline import QueryPipeline
+    from .sparse_index import BM25Index
 
 # Load environment variables
 load_dotenv()
@@ -28,6 +35,23 @@ logging.basicConfig(level=logging.INFO)
 cached_vector_store = None
 cached_llama_index = None
 cached_llm = None
+cached_embeddings = None
+cached_answer_cache = None
+cached_query_pipeline = None
+cached_sparse_index = None
+# Bumped in the index manifest every time the indexed content changes
+index_version = 0
+# Keeps references to fire-and-forget plan generations
+_background_tasks = set()
+_embeddings_lock = threading.Lock()
+_llm_lock = threading.Lock()
+# Last error loading each lazily loaded component, for health probes
+load_errors: Dict[str, Optional[str]] = {"llm": None, "index": None}
+# Serialises index builds: warm-up and the first query must not both sync
+_index_lock = asyncio.Lock()
+# query -> (plan, expires_at), see _remember_plan
+_local_plans: "OrderedDict[str, tuple]" = OrderedDict()
+_local_plans_lock = threading.Lock()
 
 # Configuration
 USE_CPU_ONLY = os.getenv('USE_CPU_ONLY', 'false').lower() == 'true'
@@ -38,6 +62,13 @@ EMBEDDING_MODEL = os.getenv(
 TEMPERATURE = float(os.getenv('MODEL_TEMPERATURE', '0.7'))
 MAX_TOKENS = int(os.getenv('MODEL_MAX_TOKENS', '2000'))
 QUANTIZATION = int(os.getenv('MODEL_QUANTIZATION', '4'))
+MODEL_SERVER_URL = os.getenv('MODEL_SERVER_URL', '').rstrip('/')
+MODEL_SERVER_TIMEOUT = float(os.getenv('MODEL_SERVER_TIMEOUT', '600'))
+GENERATION_BATCHING = os.getenv(
+    'GENERATION_BATCHING', 'true').lower() == 'true'
+GENERATION_MAX_BATCH_SIZE = int(os.getenv('GENERATION_MAX_BATCH_SIZE', '8'))
+GENERATION_MAX_WAIT_MS = float(os.getenv('GENERATION_MAX_WAIT_MS', '20'))
+GENERATION_MAX_STREAMS = int(os.getenv('GENERATION_MAX_STREAMS', '2'))
 TEMPERATURE = float(os.getenv('AGENT_TEMPERATURE', '0.7'))
 MAX_TOKENS = int(os.getenv('OPENAI_MAX_TOKENS', '2000'))
 CHUNK_SIZE = int(os.getenv('CHUNK_SIZE', '1000'))
@@ -45,13 +76,42 @@ CHUNK_OVERLAP = int(os.getenv('CHUNK_OVERLAP', '200'))
 AGENT_MAX_STEPS = int(os.getenv('AGENT_MAX_STEPS', '10'))
 AGENT_MEMORY_SIZE = int(os.getenv('AGENT_MEMORY_SIZE', '5'))
 AGENT_CACHE_TTL = int(os.getenv('AGENT_CACHE_TTL', '3600'))
+PLAN_MODE = os.getenv('PLAN_MODE', 'wait').lower()  # wait, background or skip
+ANSWER_TIMEOUT = float(os.getenv('ANSWER_TIMEOUT', '240'))
+PLAN_TIMEOUT = float(os.getenv('PLAN_TIMEOUT', '120'))
+# Identical queries wait on one generation; the lease outlives the slowest one
+SINGLE_FLIGHT_LEASE_MS = int(os.getenv(
+    'SINGLE_FLIGHT_LEASE_MS', str(int((max(ANSWER_TIMEOUT, PLAN_TIMEOUT) + 10) * 1000))))
+SINGLE_FLIGHT_POLL_MS = float(os.getenv('SINGLE_FLIGHT_POLL_MS', '100'))
+EMBEDDING_BATCH_WINDOW_MS = float(os.getenv('EMBEDDING_BATCH_WINDOW_MS', '5'))
+EMBEDDING_MAX_BATCH_SIZE = int(os.getenv('EMBEDDING_MAX_BATCH_SIZE', '64'))
+EMBEDDING_CACHE_SIZE = int(os.getenv('EMBEDDING_CACHE_SIZE', '10000'))
+EMBEDDING_DISK_CACHE = os.getenv(
+    'EMBEDDING_DISK_CACHE', 'true').lower() == 'true'
 
 # Configuration from environment variables
 CHROMA_DB_DIR = os.getenv('CHROMA_DB_DIR', './chroma_db')
-LLAMA_INDEX_STORAGE_DIR = os.getenv('LLAMA_INDEX_STORAGE_DIR', './storage')
+# The manifest lives inside the Chroma directory so it shares its volume
+INDEX_MANIFEST_PATH = os.getenv(
+    'INDEX_MANIFEST_PATH', os.path.join(CHROMA_DB_DIR, 'index_manifest.json'))
+INCREMENTAL_INDEXING = os.getenv(
+    'INCREMENTAL_INDEXING', 'true').lower() == 'true'
+INDEX_BATCH_SIZE = int(os.getenv('INDEX_BATCH_SIZE', '256'))
+RETRIEVER_K = int(os.getenv('RETRIEVER_K', '3'))
+# Candidates each retriever contributes before rank fusion
+FUSION_CANDIDATES = int(os.getenv('FUSION_CANDIDATES', '10'))
+# Per-source limit when the RAG agent fans out to its retrievers
+RETRIEVAL_TIMEOUT = float(os.getenv('RETRIEVAL_TIMEOUT', '5'))
+SPARSE_INDEX_PATH = os.getenv(
+    'SPARSE_INDEX_PATH', os.path.join(CHROMA_DB_DIR, 'sparse_index.json'))
+LOADER_THREADS = int(os.getenv('LOADER_THREADS', '8'))
+EMBEDDING_CACHE_DIR = os.getenv('EMBEDDING_CACHE_DIR', './embedding_cache')
 REPO_DIR = os.getenv('REPO_DIR', './repos')
-REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
-CACHE_EXPIRATION = 3600  # 1 hour
+# Answers are invalidated when the chunks they cite change, so they can live long
+CACHE_EXPIRATION = int(os.getenv('ANSWER_CACHE_TTL', '604800'))
+ANSWER_CACHE_L1_SIZE = int(os.getenv('ANSWER_CACHE_L1_SIZE', '1024'))
+ANSWER_CACHE_L1_TTL = float(os.getenv('ANSWER_CACHE_L1_TTL', '300'))
+ANSWER_CACHE_SIMILARITY = float(os.getenv('ANSWER_CACHE_SIMILARITY', '0.9'))
 
 REPOS = {
     'coderabbit': {
@@ -68,14 +128,6 @@ REPOS = {
     }
 }
 
-# Initialize caches
-redis_client = Redis.from_url(REDIS_URL)
-semantic_cache = RedisSemanticCache(
-    redis_url=REDIS_URL,
-    embedding=get_embeddings(),
-    score_threshold=0.2
-)
-
 # Lightweight model options for CPU-only mode
 CPU_FRIENDLY_MODELS = {
     'llm': 'TheBloke/Mistral-7B-Instruct-v0.2-GGUF',
@@ -85,13 +137,77 @@ CPU_FRIENDLY_MODELS = {
 # Initialize LLM
 
 
+def _use_gpu() -> bool:
+    import torch
+    return not USE_CPU_ONLY and torch.cuda.is_available()
+
+
 def get_llm():
+    """Return the LLM used by chains and agents
+
+    With MODEL_SERVER_URL set this is a thin client for the shared model
+    server (see model_server.py), so web workers never load weights
+    themselves; otherwise the model is loaded into this process, once,
+    however many threads ask for it at the same time.
+    """
+    global cached_llm
+    if cached_llm is not None:
+        return cached_llm
+
+    with _llm_lock:
+        if cached_llm is not None:
+            return cached_llm
+
+        if MODEL_SERVER_URL:
+            from .model_client import RemoteLLM
+            logging.info(f"Using model server at {MODEL_SERVER_URL}")
+            cached_llm = RemoteLLM(
+                server_url=MODEL_SERVER_URL, timeout=MODEL_SERVER_TIMEOUT)
+            return cached_llm
+
+        try:
+            llm = load_local_llm()
+        except Exception as e:
+            load_errors["llm"] = str(e)
+            raise
+        load_errors["llm"] = None
+        return llm
+
+
+async def aget_llm():
+    """get_llm for coroutines: loading a model must not block the shared loop"""
+    if cached_llm is not None:
+        return cached_llm
+    return await asyncio.get_running_loop().run_in_executor(None, get_llm)
+
+
+def _pipeline_llm(pipe):
+    """Wrap a text-generation pipeline, batching concurrent prompts if enabled"""
+    if GENERATION_BATCHING:
+        from .batching import BatchingEngine, BatchedPipelineLLM
+        return BatchedPipelineLLM(BatchingEngine(
+            pipe,
+            max_batch_size=GENERATION_MAX_BATCH_SIZE,
+            max_wait_ms=GENERATION_MAX_WAIT_MS,
+            max_streams=GENERATION_MAX_STREAMS
+        ))
+
+    from langchain_community.llms import HuggingFacePipeline
+    return HuggingFacePipeline(pipeline=pipe)
+
+
+def load_local_llm():
+    """Load the configured model into this process"""
     global cached_llm
     if cached_llm is not None:
         return cached_llm
 
+    import torch
+    from transformers import AutoTokenizer, AutoModelForCausalLM, pipeline
+    from langchain_community.llms import CTransformers
+
     try:
-        if USE_CPU_ONLY or not torch.cuda.is_available():
+        if not _use_gpu():
             logging.info("Using CPU-optimized model")
             if MODEL_TYPE == 'gguf':
                 # Use GGUF model with CTransformers for CPU
@@ -132,7 +248,7 @@ def get_llm():
                 top_p=0.95,
                 repetition_penalty=1.15
             )
-            cached_llm = HuggingFacePipeline(pipeline=pipe)
+            cached_llm = _pipeline_llm(pipe)
 
         return cached_llm
     except Exception as e:
@@ -152,23 +268,157 @@ def get_llm():
             max_new_tokens=MAX_TOKENS,
             temperature=TEMPERATURE
         )
-        cached_llm = HuggingFacePipeline(pipeline=pipe)
+        cached_llm = _pipeline_llm(pipe)
         return cached_llm
 
 # Initialize embeddings
 
 
-def get_embeddings():
-    if USE_CPU_ONLY or not torch.cuda.is_available():
-        model_name = CPU_FRIENDLY_MODELS['embeddings']
-    else:
-        model_name = EMBEDDING_MODEL
+def get_embedding_model_name() -> str:
+    if not _use_gpu():
+        return CPU_FRIENDLY_MODELS['embeddings']
+    return EMBEDDING_MODEL
+
+
+def get_embeddings() -> EmbeddingService:
+    """Return the process-wide embedding service, loading the model once"""
+    global cached_embeddings
+    if cached_embeddings is not None:
+        return cached_embeddings
+
+    from .embeddings import EmbeddingService, DiskEmbeddingCache
+
+    with _embeddings_lock:
+        if cached_embeddings is None:
+            disk_cache = None
+            if EMBEDDING_DISK_CACHE:
+                disk_cache = DiskEmbeddingCache(
+                    EMBEDDING_CACHE_DIR, get_embedding_model_name())
+            cached_embeddings = EmbeddingService(
+                model_name=get_embedding_model_name(),
+                device='cuda' if _use_gpu() else 'cpu',
+                batch_window_ms=EMBEDDING_BATCH_WINDOW_MS,
+                max_batch_size=EMBEDDING_MAX_BATCH_SIZE,
+                cache_size=EMBEDDING_CACHE_SIZE,
+                disk_cache=disk_cache
+            )
+    return cached_embeddings
 
-    return HuggingFaceEmbeddings(
-        model_name=model_name,
-        model_kwargs={'device': 'cuda' if torch.cuda.is_available()
-                      and not USE_CPU_ONLY else 'cpu'}
-    )
+
+# Initialize caches
+redis_client = get_redis()
+redis_store = RedisStore(redis_client)
+single_flight = SingleFlight(
+    redis_client,
+    lease_ms=SINGLE_FLIGHT_LEASE_MS,
+    poll_interval=SINGLE_FLIGHT_POLL_MS / 1000
+)
+
+
+def get_answer_cache() -> AnswerCache:
+    """Create the two-tier answer cache on first use (it loads the embedder)"""
+    global cached_answer_cache
+    if cached_answer_cache is None:
+        from .answer_cache import AnswerCache
+        cached_answer_cache = AnswerCache(
+            redis_store,
+            get_embeddings(),
+            ttl=CACHE_EXPIRATION,
+            l1_size=ANSWER_CACHE_L1_SIZE,
+            l1_ttl=ANSWER_CACHE_L1_TTL,
+            similarity_threshold=ANSWER_CACHE_SIMILARITY
+        )
+    return cached_answer_cache
+
+
+async def _cached_answer(query: str, count: bool = True) -> Optional[Dict[str, Any]]:
+    """Return a cached answer for the query (or a near-duplicate of it), if any"""
+    cached_result = await asyncio.get_running_loop().run_in_executor(
+        None, get_answer_cache().lookup, query, count)
+    if cached_result is not None:
+        logging.info(f"Answer cache ({cached_result['cache']}) hit for query: {query}")
+        return {**cached_result, "source": "cache"}
+    return None
+
+
+def _local_plan(query: str) -> Optional[List[str]]:
+    with _local_plans_lock:
+        entry = _local_plans.get(query)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        _local_plans.move_to_end(query)
+        return entry[0]
+
+
+def _remember_plan(query: str, plan: List[str]):
+    """Keep a plan in process so L1 answer hits can attach it without Redis"""
+    with _local_plans_lock:
+        _local_plans[query] = (plan, time.monotonic() + ANSWER_CACHE_L1_TTL)
+        _local_plans.move_to_end(query)
+        while len(_local_plans) > ANSWER_CACHE_L1_SIZE:
+            _local_plans.popitem(last=False)
+
+
+async def _cached_plan(query: str) -> Optional[List[str]]:
+    plan = _local_plan(query)
+    if plan is None:
+        plan = await asyncio.get_running_loop().run_in_executor(
+            None, redis_store.get, hashed_key("plan", query))
+        if plan:
+            _remember_plan(query, plan)
+    return plan
+
+
+async def lookup_answer(query: str, plan_mode: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """Return the cached result for a query if nothing needs generating
+
+    Answers are cached without a plan; this is a hit only when the plan
+    ``plan_mode`` asks for is cached too (or no plan is wanted). The plan
+    is read in the same Redis round trip as the answer, or not at all when
+    this process has it, so an L1 hit with a local plan never touches Redis.
+
+    Stats are counted only for a hit; on a miss process_query (or
+    stream_query) counts the request.
+    """
+    skip = (plan_mode or PLAN_MODE) == "skip"
+    plan = None if skip else _local_plan(query)
+    plan_keys = [] if skip or plan is not None else [hashed_key("plan", query)]
+    answer_cache = get_answer_cache()
+    cached_result, values = await asyncio.get_running_loop().run_in_executor(
+        None, answer_cache.lookup_with, query, plan_keys, False)
+    if cached_result is None:
+        return None
+    if plan_keys:
+        plan = values[0]
+        if plan is None:
+            return None
+        _remember_plan(query, plan)
+    plan_status = "skipped" if skip else "ready"
+    answer_cache.record(cached_result["cache"])
+    logging.info(f"Answer cache ({cached_result['cache']}) hit for query: {query}")
+    return {**cached_result, "source": "cache", "plan": plan, "plan_status": plan_status}
+
+
+async def store_answer(query: str, result: Dict[str, Any]):
+    """Cache an answer unless the index changed since it was generated
+
+    Invalidation only removes answers that are already cached, so one
+    generated from the previous index and stored after the refresh would
+    otherwise outlive it for the whole cache TTL.
+    """
+    version = result.get("index_version")
+    if version != index_version:
+        logging.info(
+            f"Not caching answer from index version {version} "
+            f"(now {index_version}) for query: {query}")
+        return
+    answer_cache = get_answer_cache()
+    await asyncio.get_running_loop().run_in_executor(
+        None, answer_cache.store, query, result)
+    if version != index_version:
+        # The index changed while storing, maybe after its invalidation ran
+        await asyncio.get_running_loop().run_in_executor(
+            None, answer_cache.discard, query)
 
 
 def sync_repositories():
@@ -190,171 +440,226 @@ def sync_repositories():
                 logging.error(f"Error pulling {repo_name} repository: {e}")
 
 
-def build_llama_index():
-    """Build LlamaIndex from all repositories."""
+def _llama_embed_model():
+    """Adapt the shared embedding service (and its disk cache) to LlamaIndex"""
+    from llama_index.embeddings.langchain import LangchainEmbedding
+    return LangchainEmbedding(get_embeddings())
+
+
+async def build_llama_index():
+    """Open a retrieve-only LlamaIndex view of the shared Chroma collection
+
+    LlamaIndex keeps no chunks or embeddings of its own: it reads the
+    collection maintained by build_vector_store. Returns None when the
+    configured vector store backend isn't Chroma.
+    """
     global cached_llama_index
 
     if cached_llama_index is not None:
-        logging.info("Using cached LlamaIndex.")
         return cached_llama_index
 
-    # Check if we have a saved index
-    if os.path.exists(LLAMA_INDEX_STORAGE_DIR):
-        try:
-            storage_context = StorageContext.from_defaults(
-                persist_dir=LLAMA_INDEX_STORAGE_DIR)
-            cached_llama_index = load_index_from_storage(storage_context)
-            logging.info("Loaded LlamaIndex from storage.")
-            return cached_llama_index
-        except Exception as e:
-            logging.error(f"Error loading saved index: {e}")
+    from .vector_stores import VECTOR_STORE_TYPE
 
-    # Sync repositories first
-    sync_repositories()
+    vector_store = await build_vector_store()
+    if VECTOR_STORE_TYPE != 'chroma':
+        logging.info(
+            f"LlamaIndex retrieval is unavailable with the {VECTOR_STORE_TYPE} backend")
+        return None
 
-    # Load documents from all repositories
-    all_documents = []
-    for repo_name, repo_info in REPOS.items():
-        try:
-            documents = SimpleDirectoryReader(
-                repo_info['local_path']).load_data()
-            all_documents.extend(documents)
-            logging.info(f"Loaded documents from {repo_name}")
-        except Exception as e:
-            logging.error(f"Error loading documents from {repo_name}: {e}")
+    from llama_index.core import VectorStoreIndex
+    from llama_index.vector_stores.chroma import ChromaVectorStore
 
-    # Create and save index
-    parser = SimpleNodeParser()
-    nodes = parser.get_nodes_from_documents(all_documents)
-    index = VectorStoreIndex(nodes)
-    index.storage_context.persist(LLAMA_INDEX_STORAGE_DIR)
+    cached_llama_index = VectorStoreIndex.from_vector_store(
+        ChromaVectorStore(chroma_collection=vector_store._collection),
+        embed_model=_llama_embed_model()
+    )
+    return cached_llama_index
+
+
+async def process_query(query: str, plan_mode: Optional[str] = None) -> Dict[str, Any]:
+    """Process a natural language query using RAG with semantic caching
+
+    The answer and the execution plan are generated concurrently.
+    ``plan_mode`` (default PLAN_MODE) decides what happens to the plan:
+    ``wait`` includes it if ready within PLAN_TIMEOUT, ``background``
+    returns as soon as the answer is ready and leaves the plan generating
+    into the plan cache (fetch it later via agent_orchestrator), and
+    ``skip`` doesn't generate one.
+
+    Concurrent identical queries (after normalization), in this process
+    or any other worker, share a single answer generation. Answers are
+    cached without their plan, so a plan-less or timed-out result is never
+    served to a caller that asked for a plan.
+    """
+    plan_mode = plan_mode or PLAN_MODE
+    plan_task = None
+    try:
+        # Start planning right away; it doesn't depend on the answer
+        if plan_mode != "skip":
+            plan_task = asyncio.ensure_future(
+                asyncio.wait_for(agent_orchestrator(query), PLAN_TIMEOUT))
+            if plan_mode == "background":
+                # agent_orchestrator caches the plan when it completes
+                _background_tasks.add(plan_task)
+                plan_task.add_done_callback(_background_tasks.discard)
+
+        # Answers are cached and shared without a plan; each request gets
+        # the plan its own plan_mode asked for
+        result = await _cached_answer(query)
+        if result is None:
+            from .answer_cache import normalize_query
+            result = await single_flight.run(
+                normalize_query(query),
+                lambda: _answer_query(query),
+                # Polled while another caller generates; not a new request
+                lambda: _cached_answer(query, count=False)
+            )
+        return {**result, **await _plan_result(query, plan_task, plan_mode)}
 
-    cached_llama_index = index
-    return index
+    except Exception as e:
+        logging.exception("Error processing query")
+        return {
+            "error": str(e),
+            "stack_trace": traceback.format_exc()
+        }
+    finally:
+        # No-op once the plan is done; stops it if the answer failed
+        if plan_task is not None and plan_mode != "background":
+            plan_task.cancel()
+
+
+async def _plan_result(query: str, plan_task: Optional[asyncio.Future],
+                       plan_mode: str) -> Dict[str, Any]:
+    if plan_task is None:
+        return {"plan": None, "plan_status": "skipped"}
+    if plan_mode == "background":
+        if plan_task.done() and not plan_task.cancelled() and plan_task.exception() is None:
+            return {"plan": plan_task.result(), "plan_status": "ready"}
+        return {"plan": None, "plan_status": "pending"}
+    try:
+        return {"plan": await plan_task, "plan_status": "ready"}
+    except asyncio.TimeoutError:
+        logging.warning(f"Plan generation timed out for query: {query}")
+        return {"plan": None, "plan_status": "timeout"}
+
+
+async def _answer_query(query: str) -> Dict[str, Any]:
+    """Generate and cache the answer for a cache miss"""
+    pipeline = await get_query_pipeline()
+    result = await asyncio.wait_for(pipeline.answer(query), ANSWER_TIMEOUT)
+    source_docs = result.get("source_documents", [])
+
+    result = {
+        "query": query,
+        "answer": result["result"],
+        "source_documents": [doc.page_content for doc in source_docs],
+        "chunk_ids": _chunk_ids(source_docs),
+        "index_version": pipeline.version,
+        "source": "live",
+        "model": "huggingface",
+        "temperature": TEMPERATURE,
+        "max_tokens": MAX_TOKENS
+    }
+    await store_answer(query, result)
+    return result
 
 
-async def process_query(query: str) -> Dict[str, Any]:
-    """Process a natural language query using RAG with semantic caching"""
-    try:
-        # Check semantic cache first
-        cached_result = semantic_cache.lookup(query, "default_llm")
-        if cached_result:
-            logging.info(f"Semantic cache hit for query: {query}")
-            return {
-                "query": query,
-                "answer": cached_result,
-                "source": "cache"
-            }
-
-        # Load vector store and create retriever
-        vector_store = await build_vector_store()
-        retriever = vector_store.as_retriever(search_kwargs={"k": 3})
-
-        # Initialize QA chain with configured LLM
-        qa = RetrievalQA.from_chain_type(
-            llm=get_llm(),
-            chain_type="stuff",
-            retriever=retriever,
-            return_source_documents=True
-        )
+# Same wording as LangChain's default "stuff" QA prompt used by process_query
+STREAM_QA_PROMPT = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
 
-        # Get response
-        result = await qa.ainvoke({"query": query})
-        answer = result["result"]
-        source_docs = result.get("source_documents", [])
+{context}
 
-        # Cache the result
-        semantic_cache.update(query, "default_llm", answer)
+Question: {question}
+Helpful Answer:"""
 
-        # Get execution plan with configured parameters
-        plan = await agent_orchestrator(query)
 
-        return {
+def _chunk_ids(docs: Iterable[Document]) -> List[str]:
+    """Chunks an answer was generated from, for cache invalidation"""
+    return [doc.metadata["chunk_id"] for doc in docs if "chunk_id" in doc.metadata]
+
+
+def _source_snippet(doc: Document) -> Dict[str, Any]:
+    return {
+        "content": doc.page_content,
+        "file_path": doc.metadata.get("file_path"),
+        "start_line": doc.metadata.get("start_line"),
+        "end_line": doc.metadata.get("end_line")
+    }
+
+
+async def stream_query(query: str) -> AsyncIterator[Dict[str, Any]]:
+    """Answer a query incrementally
+
+    Yields a ``sources`` event with the retrieved snippets as soon as
+    retrieval finishes, then ``token`` events as the LLM generates, and a
+    final ``done`` event carrying the full answer (or an ``error`` event).
+    Callers check the cache first (see lookup_answer), so this counts a miss.
+    """
+    get_answer_cache().record(None)
+    try:
+        pipeline = await get_query_pipeline()
+        docs = await pipeline.retrieve(query)
+        yield {"type": "sources", "sources": [_source_snippet(doc) for doc in docs]}
+
+        prompt = STREAM_QA_PROMPT.format(
+            context="\n\n".join(doc.page_content for doc in docs),
+            question=query
+        )
+        answer = []
+        llm = await aget_llm()
+        async for token in llm.astream(prompt):
+            answer.append(token)
+            yield {"type": "token", "text": token}
+
+        result = {
             "query": query,
-            "answer": answer,
-            "source_documents": [doc.page_content for doc in source_docs],
-            "plan": plan,
-            "source": "live",
-            "model": "huggingface",
-            "temperature": TEMPERATURE,
-            "max_tokens": MAX_TOKENS
+            "answer": "".join(answer),
+            "source_documents": [doc.page_content for doc in docs],
+            "chunk_ids": _chunk_ids(docs),
+            "index_version": pipeline.version,
+            "source": "live"
         }
+        await store_answer(query, result)
+        yield {"type": "done", **result}
 
     except Exception as e:
-        logging.exception("Error processing query")
-        return {
-            "error": str(e),
-            "stack_trace": traceback.format_exc()
-        }
+        logging.exception("Error streaming query")
+        yield {"type": "error", "error": str(e)}
+
+
+def iter_source_documents() -> Iterator[Document]:
+    """Stream one Document per file from the repositories and local docs"""
+    from .loaders import DOCUMENT_EXTENSIONS, iter_documents
+
+    sources = []
+    for repo_name, repo_info in REPOS.items():
+        repo_path = repo_info['local_path']
+
+        # Skip if repo doesn't exist
+        if not os.path.exists(repo_path):
+            logging.warning(
+                f"Repository {repo_name} not found at {repo_path}")
+            continue
+
+        sources.append((
+            repo_path,
+            {"source": repo_name, "repo_url": repo_info.get("url", "")},
+            DOCUMENT_EXTENSIONS
+        ))
+
+    docs_dir = os.path.join(os.path.dirname(__file__), "documentation")
+    if os.path.exists(docs_dir):
+        sources.append((docs_dir, {"source": "documentation"}, {".md", ".txt"}))
+
+    return iter_documents(sources, max_workers=LOADER_THREADS)
 
 
 async def load_documents() -> List[Document]:
     """Load and process documents from multiple sources"""
     try:
-        docs = []
-
-        # Load from repositories
-        for repo_name, repo_info in REPOS.items():
-            repo_path = os.path.join(REPO_DIR, repo_name)
-
-            # Skip if repo doesn't exist
-            if not os.path.exists(repo_path):
-                logging.warning(
-                    f"Repository {repo_name} not found at {repo_path}")
-                continue
-
-            # Load markdown and text files
-            for ext in [".md", ".txt", ".py", ".js", ".ts"]:
-                for root, _, files in os.walk(repo_path):
-                    for file in files:
-                        if file.endswith(ext):
-                            try:
-                                file_path = os.path.join(root, file)
-                                with open(file_path, 'r', encoding='utf-8') as f:
-                                    content = f.read()
-
-                                # Create document with metadata
-                                doc = Document(
-                                    page_content=content,
-                                    metadata={
-                                        "source": repo_name,
-                                        "file_path": file_path,
-                                        "file_type": ext,
-                                        "repo_url": repo_info.get("url", "")
-                                    }
-                                )
-                                docs.append(doc)
-
-                            except Exception as e:
-                                logging.error(
-                                    f"Error loading file {file_path}: {str(e)}")
-                                continue
-
-        # Load documentation files
-        docs_dir = os.path.join(os.path.dirname(__file__), "documentation")
-        if os.path.exists(docs_dir):
-            for file in os.listdir(docs_dir):
-                if file.endswith((".md", ".txt")):
-                    try:
-                        file_path = os.path.join(docs_dir, file)
-                        with open(file_path, 'r', encoding='utf-8') as f:
-                            content = f.read()
-
-                        doc = Document(
-                            page_content=content,
-                            metadata={
-                                "source": "documentation",
-                                "file_path": file_path,
-                                "file_type": os.path.splitext(file)[1]
-                            }
-                        )
-                        docs.append(doc)
-
-                    except Exception as e:
-                        logging.error(
-                            f"Error loading documentation file {file}: {str(e)}")
-                        continue
-
+        loop = asyncio.get_running_loop()
+        docs = await loop.run_in_executor(
+            None, lambda: list(iter_source_documents()))
         logging.info(f"Loaded {len(docs)} documents")
         return docs
 
@@ -363,31 +668,307 @@ async def load_documents() -> List[Document]:
         return []
 
 
-async def build_vector_store(docs: Optional[List[Document]] = None) -> Chroma:
-    """Build or retrieve cached vector store"""
-    global cached_vector_store
+def _content_hash(content: str) -> str:
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _load_index_manifest() -> Dict[str, Any]:
+    """Load the per-file content hash manifest of the vector store"""
+    if os.path.exists(INDEX_MANIFEST_PATH):
+        try:
+            with open(INDEX_MANIFEST_PATH, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logging.error(f"Error reading index manifest: {e}")
+    return {"files": {}}
+
+
+def _save_index_manifest(manifest: Dict[str, Any]):
+    """Atomically write the index manifest"""
+    os.makedirs(os.path.dirname(INDEX_MANIFEST_PATH) or '.', exist_ok=True)
+    tmp_path = f"{INDEX_MANIFEST_PATH}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, INDEX_MANIFEST_PATH)
+
+
+def _iter_chunks(docs: Iterable[Document]) -> Iterator[Document]:
+    """Chunk whole-file documents and give every chunk a stable id"""
+    from .chunking import chunk_documents
+
+    for chunk in chunk_documents(docs, CHUNK_SIZE, CHUNK_OVERLAP):
+        path_key = _content_hash(chunk.metadata["file_path"])[:16]
+        chunk.metadata["chunk_id"] = f"{path_key}:{chunk.metadata['chunk_index']}"
+        yield chunk
+
+
+def _index_settings() -> Dict[str, Any]:
+    """Settings that invalidate every stored vector when they change"""
+    from .vector_stores import index_settings
+
+    return {
+        "embedding_model": get_embedding_model_name(),
+        "chunk_size": CHUNK_SIZE,
+        "chunk_overlap": CHUNK_OVERLAP,
+        "vector_store": index_settings()
+    }
 
-    if cached_vector_store is not None:
+
+def _sync_vector_store(vector_store: VectorStore, docs: Iterable[Document],
+                       manifest: Dict[str, Any], sparse_index: BM25Index) -> List[str]:
+    """Embed only added or changed files and drop vectors of removed ones
+
+    ``docs`` holds one whole-file Document per file and may be a lazy
+    iterator: changed files are chunked and embedded while the rest of
+    the sources are still being read. The sparse index receives the same
+    chunk additions and removals, and the store is persisted. Returns the
+    ids of chunks whose content changed or disappeared.
+    """
+    previous = manifest.get("files", {}) if INCREMENTAL_INDEXING else {}
+
+    invalidated = []
+    if not INCREMENTAL_INDEXING and manifest.get("files"):
+        # Full rebuild: drop everything the manifest knows about
+        invalidated = [
+            doc_id for entry in manifest["files"].values()
+            for doc_id in entry["ids"]
+        ]
+        vector_store.delete(ids=invalidated)
+        sparse_index.clear()
+
+    current = {}
+    stale_ids = []
+    batch = []
+    seen = 0
+    changed = 0
+    chunk_count = 0
+
+    def flush():
+        nonlocal stale_ids, batch, chunk_count
+        if stale_ids:
+            vector_store.delete(ids=stale_ids)
+            sparse_index.remove(stale_ids)
+            stale_ids = []
+        if batch:
+            vector_store.add_documents(
+                batch, ids=[c.metadata["chunk_id"] for c in batch])
+            sparse_index.add(batch)
+            chunk_count += len(batch)
+            batch = []
+
+    for doc in docs:
+        seen += 1
+        file_path = doc.metadata["file_path"]
+        digest = _content_hash(doc.page_content)
+        entry = previous.get(file_path)
+        if entry and entry["hash"] == digest:
+            current[file_path] = entry
+            if not all(chunk_id in sparse_index for chunk_id in entry["ids"]):
+                # Backfill a sparse index that is missing or out of date
+                sparse_index.add(_iter_chunks([doc]))
+            continue
+
+        changed += 1
+        if entry:
+            stale_ids.extend(entry["ids"])
+            invalidated.extend(entry["ids"])
+        current[file_path] = {"hash": digest, "ids": []}
+        for chunk in _iter_chunks([doc]):
+            current[file_path]["ids"].append(chunk.metadata["chunk_id"])
+            batch.append(chunk)
+            if len(batch) >= INDEX_BATCH_SIZE:
+                flush()
+
+    if not seen and previous:
+        logging.warning(
+            "No documents loaded; keeping the existing vector store untouched")
+        return []
+
+    removed = previous.keys() - current.keys()
+    for file_path in removed:
+        stale_ids.extend(previous[file_path]["ids"])
+        invalidated.extend(previous[file_path]["ids"])
+    flush()
+    # Write the store out before the manifest that describes it (FAISS
+    # rebuilds and saves its whole index here)
+    vector_store.persist()
+
+    if changed or removed or not INCREMENTAL_INDEXING:
+        manifest["version"] = manifest.get("version", 0) + 1
+    manifest["files"] = current
+    manifest["settings"] = _index_settings()
+    _save_index_manifest(manifest)
+    sparse_index.save(manifest.get("version", 0))
+    logging.info(
+        f"Vector store synced: {changed} files added or changed "
+        f"({chunk_count} chunks embedded), {len(removed)} removed, "
+        f"{seen - changed} unchanged")
+    return invalidated
+
+
+async def build_vector_store(docs: Optional[Iterable[Document]] = None,
+                             refresh: bool = False) -> VectorStore:
+    """Build or retrieve cached vector store, re-embedding only changed files
+
+    A persisted store built with the current embedding model and chunk
+    settings is reopened as-is; pass ``refresh=True`` (e.g. after
+    ``sync_repositories``) to re-scan the sources for changes. Concurrent
+    callers wait for one build and then reuse its store.
+    """
+    if cached_vector_store is not None and not refresh and docs is None:
         logging.info("Using cached vector store")
         return cached_vector_store
 
-    if docs is None:
-        docs = await load_documents()
+    async with _index_lock:
+        try:
+            vector_store = await _build_vector_store(docs, refresh)
+        except Exception as e:
+            load_errors["index"] = str(e)
+            raise
+        load_errors["index"] = None
+        return vector_store
 
-    embeddings = get_embeddings()
 
-    # Build Chroma vector store with persistence
-    vector_store = Chroma.from_documents(
-        documents=docs,
-        embedding=embeddings,
-        persist_directory=CHROMA_DB_DIR
-    )
-    vector_store.persist()
+async def _build_vector_store(docs: Optional[Iterable[Document]],
+                              refresh: bool) -> VectorStore:
+    global cached_vector_store, index_version
+
+    # Another caller may have finished the build while we waited
+    if cached_vector_store is not None and not refresh and docs is None:
+        return cached_vector_store
+
+    from .vector_stores import VECTOR_STORE_TYPE, open_vector_store, count_vectors
+
+    manifest = _load_index_manifest()
+    settings_match = manifest.get("settings") == _index_settings()
+    rebuild = not settings_match and bool(manifest.get("files"))
+    if rebuild:
+        logging.info(
+            "Embedding model, chunk or vector store settings changed; "
+            "rebuilding vector store")
+        # Keep counting versions so the new index never reuses an old one
+        manifest = {"files": {}, "version": manifest.get("version", 0)}
+
+    vector_store = cached_vector_store
+    if vector_store is None or rebuild:
+        vector_store = open_vector_store(get_embeddings(), reset=rebuild)
+    if not rebuild and not manifest.get("files") and count_vectors(vector_store):
+        # Vectors without a manifest predate it (whole files under random
+        # ids) and would otherwise sit next to the new chunks forever
+        logging.info("Vector store has no index manifest; rebuilding vector store")
+        rebuild = True
+        vector_store = open_vector_store(get_embeddings(), reset=True)
+    loop = asyncio.get_running_loop()
+    # First use reads the BM25 index JSON from disk
+    sparse_index = await loop.run_in_executor(None, get_sparse_index)
+    if rebuild:
+        sparse_index.clear()
+
+    # Warm start: the persisted index already matches this configuration
+    if (settings_match and not refresh and docs is None
+            and manifest.get("files") and count_vectors(vector_store)
+            and sparse_index.version == manifest.get("version", 0)):
+        logging.info(f"Reopened persisted {VECTOR_STORE_TYPE} vector store")
+        index_version = manifest.get("version", 0)
+        cached_vector_store = vector_store
+        return vector_store
 
+    if docs is None:
+        docs = iter_source_documents()
+
+    # Walking, chunking and embedding all block, so keep them off the loop
+    invalidated = await loop.run_in_executor(
+        None, _sync_vector_store, vector_store, docs, manifest, sparse_index)
+    # Switch versions before invalidating, so store_answer turns away
+    # answers still being generated from the old index
+    index_version = manifest.get("version", 0)
     cached_vector_store = vector_store
+    if invalidated:
+        # Only answers citing changed chunks go; the rest stay cached
+        await loop.run_in_executor(
+            None, get_answer_cache().invalidate_chunks, invalidated)
     return vector_store
 
 
+def get_sparse_index() -> BM25Index:
+    """Return the BM25 index kept alongside the vector store"""
+    global cached_sparse_index
+
+    if cached_sparse_index is None:
+        from .sparse_index import BM25Index
+        cached_sparse_index = BM25Index.load(SPARSE_INDEX_PATH)
+    return cached_sparse_index
+
+
+async def get_query_pipeline() -> QueryPipeline:
+    """Return the retriever and QA chain for the current index version
+
+    Built on first use and again only after the index changes; the new
+    pipeline is swapped in with a single assignment, so concurrent queries
+    never see a half-built one.
+    """
+    global cached_query_pipeline
+
+    vector_store = await build_vector_store()
+    pipeline = cached_query_pipeline
+    if (pipeline is None or pipeline.version != index_version
+            or pipeline.vector_store is not vector_store):
+        from .pipeline import QueryPipeline
+        pipeline = QueryPipeline(
+            vector_store, await aget_llm(), index_version, k=RETRIEVER_K,
+            sparse_index=get_sparse_index())
+        cached_query_pipeline = pipeline
+        logging.info(f"Built query pipeline for index version {index_version}")
+    return pipeline
+
+
+async def warm_up(load_llm: bool = True):
+    """Load the embedding model, retrieval indexes and (optionally) the LLM now
+
+    Everything is otherwise created lazily by the first query; call this
+    at startup to move that cost out of the first request.
+    """
+    loop = asyncio.get_running_loop()
+
+    async def load_indexes():
+        await loop.run_in_executor(None, get_embeddings)
+        await build_vector_store()
+        try:
+            await build_llama_index()
+        except Exception:
+            # Optional extra retrieval source; queries work without it
+            logging.exception("LlamaIndex view failed to load")
+
+    # The LLM doesn't need the indexes, so an index failure mustn't keep
+    # it from loading (and the readiness probe from seeing why)
+    await asyncio.gather(load_indexes(), *([aget_llm()] if load_llm else []))
+    if load_llm:
+        await get_query_pipeline()
+    logging.info("RAG module warmed up")
+
+
+def component_status() -> Dict[str, Any]:
+    """What this process has loaded so far; reads globals only, never loads anything"""
+    return {
+        "llm_loaded": cached_llm is not None,
+        "llm_error": load_errors["llm"],
+        "model_server": MODEL_SERVER_URL or None,
+        "embeddings_loaded": cached_embeddings is not None,
+        "vector_store_loaded": cached_vector_store is not None,
+        "pipeline_ready": cached_query_pipeline is not None,
+        "index_error": load_errors["index"],
+        "index_version": index_version
+    }
+
+
+async def refresh_index() -> int:
+    """Pull the latest repository contents, re-index what changed and
+    drop cached answers that cited changed chunks; returns the index version"""
+    await asyncio.get_running_loop().run_in_executor(None, sync_repositories)
+    await build_vector_store(refresh=True)
+    return index_version
+
+
 def sync_and_load_documents():
     """Load local documentation and CodeRabbit docs by syncing the repository."""
     docs = []
@@ -436,10 +1017,9 @@ async def agent_orchestrator(task_description: str) -> List[str]:
     """Break down a task into executable steps with caching"""
     try:
         # Check cache for existing plan
-        cache_key = f"plan:{task_description}"
-        cached_plan = redis_client.get(cache_key)
+        cached_plan = await _cached_plan(task_description)
         if cached_plan:
-            return json.loads(cached_plan)
+            return cached_plan
 
         # Create planning prompt
         prompt = f"""Break down this task into clear executable steps:
@@ -454,17 +1034,16 @@ async def agent_orchestrator(task_description: str) -> List[str]:
         Steps:"""
 
         # Get plan from LLM
-        llm = get_llm()
+        llm = await aget_llm()
         response = await llm.agenerate([prompt])
-        steps = [step.strip() for step in response.generations[0].text.split(
+        steps = [step.strip() for step in response.generations[0][0].text.split(
             "\n") if step.strip()]
 
         # Cache the plan
-        redis_client.setex(
-            cache_key,
-            AGENT_CACHE_TTL,
-            json.dumps(steps)
-        )
+        _remember_plan(task_description, steps)
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: redis_store.set(
+                hashed_key("plan", task_description), steps, ttl=AGENT_CACHE_TTL))
 
         return steps
 
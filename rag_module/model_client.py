@@ -0,0 +1,77 @@
+import json
+import codecs
+import asyncio
+import urllib.request
+from typing import Any, AsyncIterator, List, Optional
+import aiohttp
+from langchain_core.language_models.llms import LLM
+from langchain_core.outputs import GenerationChunk
+from pydantic import PrivateAttr
+
+
+class RemoteLLM(LLM):
+    """LangChain LLM that forwards prompts to the shared model server"""
+
+    server_url: str
+    timeout: float = 600
+
+    _session: Optional[aiohttp.ClientSession] = PrivateAttr(default=None)
+    _session_loop: Any = PrivateAttr(default=None)
+
+    @property
+    def _llm_type(self) -> str:
+        return "remote_model_server"
+
+    def _payload(self, prompt: str, stop: Optional[List[str]]) -> dict:
+        return {"prompts": [prompt], "stop": stop}
+
+    def _call(self, prompt: str, stop: Optional[List[str]] = None,
+              run_manager: Any = None, **kwargs: Any) -> str:
+        request = urllib.request.Request(
+            f"{self.server_url}/generate",
+            data=json.dumps(self._payload(prompt, stop)).encode('utf-8'),
+            headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.loads(response.read())["generations"][0]
+
+    def _get_session(self) -> aiohttp.ClientSession:
+        # One pooled session per event loop
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._session.closed \
+                or self._session_loop is not loop:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._session_loop = loop
+        return self._session
+
+    async def _acall(self, prompt: str, stop: Optional[List[str]] = None,
+                     run_manager: Any = None, **kwargs: Any) -> str:
+        session = self._get_session()
+        async with session.post(
+            f"{self.server_url}/generate",
+            json=self._payload(prompt, stop)
+        ) as response:
+            if response.status != 200:
+                raise Exception(f"Model server error: {await response.text()}")
+            return (await response.json())["generations"][0]
+
+    async def _astream(self, prompt: str, stop: Optional[List[str]] = None,
+                       run_manager: Any = None,
+                       **kwargs: Any) -> AsyncIterator[GenerationChunk]:
+        session = self._get_session()
+        async with session.post(
+            f"{self.server_url}/stream",
+            json=self._payload(prompt, stop)
+        ) as response:
+            if response.status != 200:
+                raise Exception(f"Model server error: {await response.text()}")
+            # A multi-byte character may be split across network chunks
+            decoder = codecs.getincrementaldecoder('utf-8')(errors='replace')
+            async for data in response.content.iter_any():
+                text = decoder.decode(data)
+                if text:
+                    yield GenerationChunk(text=text)
+            text = decoder.decode(b'', final=True)
+            if text:
+                yield GenerationChunk(text=text)
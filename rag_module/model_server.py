@@ -0,0 +1,72 @@
+"""Local inference server that owns the single copy of the LLM.
+
+Run it once per host next to the backend workers:
+
+    python -m rag_module.model_server
+
+and point the workers at it with MODEL_SERVER_URL=http://127.0.0.1:8090.
+"""
+import os
+import asyncio
+import logging
+from aiohttp import web
+from .main import load_local_llm
+
+MODEL_SERVER_HOST = os.getenv('MODEL_SERVER_HOST', '127.0.0.1')
+MODEL_SERVER_PORT = int(os.getenv('MODEL_SERVER_PORT', '8090'))
+# Requests admitted at once; the batching engine groups them into batches
+MODEL_SERVER_CONCURRENCY = int(os.getenv('MODEL_SERVER_CONCURRENCY', '64'))
+
+
+async def generate(request: web.Request) -> web.Response:
+    data = await request.json()
+    prompts = data.get('prompts') or []
+    if not prompts:
+        return web.json_response({"error": "No prompts provided"}, status=400)
+
+    async with request.app['slots']:
+        result = await request.app['llm'].agenerate(
+            prompts, stop=data.get('stop'))
+    return web.json_response({
+        "generations": [generation[0].text for generation in result.generations]
+    })
+
+
+async def stream(request: web.Request) -> web.StreamResponse:
+    """Stream the generation for a single prompt as chunked plain text"""
+    data = await request.json()
+    prompts = data.get('prompts') or []
+    if not prompts:
+        return web.json_response({"error": "No prompts provided"}, status=400)
+
+    response = web.StreamResponse(headers={"Content-Type": "text/plain; charset=utf-8"})
+    await response.prepare(request)
+    async with request.app['slots']:
+        async for token in request.app['llm'].astream(
+                prompts[0], stop=data.get('stop')):
+            await response.write(token.encode('utf-8'))
+    await response.write_eof()
+    return response
+
+
+async def health(request: web.Request) -> web.Response:
+    return web.json_response({
+        "status": "healthy",
+        "model": request.app['llm']._llm_type
+    })
+
+
+def create_app() -> web.Application:
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app['llm'] = load_local_llm()
+    app['slots'] = asyncio.Semaphore(MODEL_SERVER_CONCURRENCY)
+    app.router.add_post('/generate', generate)
+    app.router.add_post('/stream', stream)
+    app.router.add_get('/health', health)
+    return app
+
+
+if __name__ == '__main__':
+    logging.info(
+        f"Starting model server on {MODEL_SERVER_HOST}:{MODEL_SERVER_PORT}")
+    web.run_app(create_app(), host=MODEL_SERVER_HOST, port=MODEL_SERVER_PORT)
@@ -0,0 +1,69 @@
+import asyncio
+from typing import Any, Dict, List, Optional
+from langchain.chains import RetrievalQA
+from langchain_core.documents import Document
+
+# Rank constant from the original RRF paper; damps the weight of the top ranks
+RRF_K = 60
+
+
+def reciprocal_rank_fusion(rankings: Dict[str, List[Document]],
+                           limit: Optional[int] = None,
+                           rrf_k: int = RRF_K) -> List[Dict[str, Any]]:
+    """Fuse ranked lists by summing 1 / (rrf_k + rank), one entry per chunk
+
+    ``rankings`` maps a retriever's name to its results, best first.
+    Documents are matched across lists by their ``chunk_id`` metadata.
+    """
+    fused: Dict[str, Dict[str, Any]] = {}
+    for source, docs in rankings.items():
+        for rank, doc in enumerate(docs, start=1):
+            key = doc.metadata.get("chunk_id") or doc.page_content
+            entry = fused.setdefault(key, {
+                "content": doc.page_content,
+                "metadata": doc.metadata,
+                "score": 0.0,
+                "sources": []
+            })
+            entry["score"] += 1 / (rrf_k + rank)
+            entry["sources"].append(source)
+    ranked = sorted(fused.values(), key=lambda entry: entry["score"], reverse=True)
+    return ranked[:limit] if limit else ranked
+
+
+class QueryPipeline:
+    """Retriever and QA chain built once for one version of the index
+
+    Instances are never mutated: when the index is rebuilt a new pipeline
+    replaces the old one, and queries already holding the old one finish
+    on it undisturbed.
+    """
+
+    def __init__(self, vector_store, llm, version: int, k: int = 3,
+                 sparse_index=None):
+        self.version = version
+        self.vector_store = vector_store
+        self.sparse_index = sparse_index
+        self.retriever = vector_store.as_retriever(search_kwargs={"k": k})
+        self.qa = RetrievalQA.from_chain_type(
+            llm=llm,
+            chain_type="stuff",
+            retriever=self.retriever,
+            return_source_documents=True
+        )
+
+    async def retrieve(self, query: str, k: Optional[int] = None) -> List[Document]:
+        if k is None:
+            return await self.retriever.aget_relevant_documents(query)
+        return await self.vector_store.asimilarity_search(query, k=k)
+
+    async def retrieve_sparse(self, query: str, k: int) -> List[Document]:
+        """BM25 keyword search over the same chunks as the vector store"""
+        if self.sparse_index is None:
+            return []
+        results = await asyncio.get_running_loop().run_in_executor(
+            None, self.sparse_index.search, query, k)
+        return [doc for doc, _ in results]
+
+    async def answer(self, query: str) -> Dict[str, Any]:
+        return await self.qa.ainvoke({"query": query})
@@ -0,0 +1,136 @@
+"""Shared Redis access for the backend and rag_module.
+
+Every client comes from one bounded connection pool per process (and
+per ``decode_responses`` mode), instead of each module opening its own.
+Cached values go through ``RedisStore``:
+
+* keys are ``{namespace}:{sha256 of the raw key}`` so arbitrarily long
+  queries and commands make short, fixed-size keys;
+* values are msgpack, zlib-compressed above CACHE_COMPRESS_THRESHOLD
+  bytes, behind a one-byte format marker;
+* ``mget``/``mset`` batch many keys into one round trip, and
+  ``set_indexed``/``members_many`` do the same for reverse-index sets.
+"""
+import os
+import zlib
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+import msgpack
+from redis import BlockingConnectionPool, Redis
+
+REDIS_URL = os.getenv('REDIS_URL') or "redis://{}:{}/{}".format(
+    os.getenv('REDIS_HOST', 'localhost'),
+    os.getenv('REDIS_PORT', '6379'),
+    os.getenv('REDIS_DB', '0')
+)
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', '64'))
+# Seconds a caller waits for a free pooled connection
+REDIS_POOL_TIMEOUT = float(os.getenv('REDIS_POOL_TIMEOUT', '5'))
+CACHE_COMPRESS_THRESHOLD = int(os.getenv('CACHE_COMPRESS_THRESHOLD', '1024'))
+
+RAW = b'm'
+COMPRESSED = b'z'
+
+_pools: Dict[bool, BlockingConnectionPool] = {}
+_pools_lock = threading.Lock()
+
+
+def get_redis(decode_responses: bool = False) -> Redis:
+    """Client backed by this process's shared connection pool"""
+    with _pools_lock:
+        pool = _pools.get(decode_responses)
+        if pool is None:
+            pool = BlockingConnectionPool.from_url(
+                REDIS_URL,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                timeout=REDIS_POOL_TIMEOUT,
+                decode_responses=decode_responses
+            )
+            _pools[decode_responses] = pool
+    return Redis(connection_pool=pool)
+
+
+def hashed_key(namespace: str, raw_key: str) -> str:
+    digest = hashlib.sha256(raw_key.encode('utf-8')).hexdigest()[:32]
+    return f"{namespace}:{digest}"
+
+
+def pack(value: Any, compress_threshold: int = CACHE_COMPRESS_THRESHOLD) -> bytes:
+    data = msgpack.packb(value, use_bin_type=True)
+    if len(data) > compress_threshold:
+        return COMPRESSED + zlib.compress(data, 6)
+    return RAW + data
+
+
+def unpack(data: Optional[bytes]) -> Any:
+    if data is None:
+        return None
+    marker, body = data[:1], data[1:]
+    if marker == COMPRESSED:
+        return msgpack.unpackb(zlib.decompress(body), raw=False)
+    if marker == RAW:
+        return msgpack.unpackb(body, raw=False)
+    logging.warning(f"Ignoring cached value in an unknown format ({marker!r})")
+    return None
+
+
+class RedisStore:
+    """Cache values in Redis under hashed keys with compact serialization"""
+
+    def __init__(self, client: Optional[Redis] = None,
+                 compress_threshold: int = CACHE_COMPRESS_THRESHOLD):
+        self.client = client or get_redis()
+        self.compress_threshold = compress_threshold
+
+    def get(self, key: str) -> Any:
+        return unpack(self.client.get(key))
+
+    def set(self, key: str, value: Any, ttl: Optional[int] = None) -> bool:
+        return self.client.set(key, pack(value, self.compress_threshold), ex=ttl)
+
+    def mget(self, keys: Iterable[str]) -> List[Any]:
+        keys = list(keys)
+        if not keys:
+            return []
+        return [unpack(value) for value in self.client.mget(keys)]
+
+    def mset(self, values: Dict[str, Any], ttl: Optional[int] = None):
+        """Write many values in one pipelined round trip"""
+        pipe = self.client.pipeline(transaction=False)
+        for key, value in values.items():
+            pipe.set(key, pack(value, self.compress_threshold), ex=ttl)
+        pipe.execute()
+
+    def set_indexed(self, key: str, value: Any, ttl: Optional[int],
+                    index_keys: Iterable[str]):
+        """Write a value and add its key to each of the ``index_keys`` sets,
+        in one pipelined round trip; the sets expire along with it"""
+        pipe = self.client.pipeline(transaction=False)
+        pipe.set(key, pack(value, self.compress_threshold), ex=ttl)
+        for index_key in index_keys:
+            pipe.sadd(index_key, key)
+            if ttl:
+                pipe.expire(index_key, ttl)
+        pipe.execute()
+
+    def members_many(self, keys: Iterable[str]) -> List[List[str]]:
+        """Members of many sets in one pipelined round trip"""
+        pipe = self.client.pipeline(transaction=False)
+        for key in keys:
+            pipe.smembers(key)
+        return [
+            [m.decode('utf-8') if isinstance(m, bytes) else m for m in members]
+            for members in pipe.execute()
+        ]
+
+    def delete(self, *keys: str) -> int:
+        return self.client.delete(*keys) if keys else 0
+
+    def ping(self) -> bool:
+        try:
+            return bool(self.client.ping())
+        except Exception as e:
+            logging.error(f"Redis ping failed: {e}")
+            return False
@@ -20,6 +20,7 @@ async def main():
     
     # Create orchestrator
     orchestrator = AgentOrchestrator(llm=llm, verbose=True)
+    await orchestrator.warm_up()
     
     # Example complex task that includes n8n workflow
     task = """Create a workflow that:
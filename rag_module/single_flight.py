@@ -0,0 +1,93 @@
+import uuid
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Optional
+from .redis_store import hashed_key
+
+# Deletes the lease only if we still hold it (it may have expired and been re-taken)
+RELEASE_LEASE = """
+if redis.call('get', KEYS[1]) == ARGV[1] then
+    return redis.call('del', KEYS[1])
+end
+return 0
+"""
+
+
+class SingleFlight:
+    """Coalesce identical in-flight computations
+
+    Within a process, concurrent callers with the same key share one task.
+    Across processes, the first caller takes a Redis lease
+    (``SET inflight:{hash of key} NX PX``) and computes; the others poll
+    ``lookup`` for the leader's cached result. If the lease disappears
+    without a result (the leader failed) a follower takes over. Followers
+    that waited the whole lease compute anyway.
+
+    A caller that is cancelled leaves the shared task to the others; when
+    the last one is cancelled the task is cancelled too.
+    """
+
+    def __init__(self, redis_client, lease_ms: int, poll_interval: float = 0.1):
+        self.redis = redis_client
+        self.lease_ms = lease_ms
+        self.poll_interval = poll_interval
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._waiters: Dict[asyncio.Future, int] = {}
+
+    async def run(self, key: str, compute: Callable[[], Awaitable[Any]],
+                  lookup: Callable[[], Awaitable[Optional[Any]]]) -> Any:
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._lead_or_follow(key, compute, lookup))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            logging.info(f"Joining in-flight computation for {key!r}")
+
+        self._waiters[task] = self._waiters.get(task, 0) + 1
+        try:
+            # One caller going away must not cancel the others' shared task
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[task] == 1 and not task.done():
+                logging.info(f"Cancelling {key!r}: no callers are waiting for it")
+                task.cancel()
+            raise
+        finally:
+            self._waiters[task] -= 1
+            if not self._waiters[task]:
+                del self._waiters[task]
+
+    async def _lead_or_follow(self, key: str, compute: Callable[[], Awaitable[Any]],
+                              lookup: Callable[[], Awaitable[Optional[Any]]]) -> Any:
+        loop = asyncio.get_running_loop()
+        lease_key = hashed_key("inflight", key)
+        token = uuid.uuid4().hex
+        deadline = loop.time() + self.lease_ms / 1000
+
+        while True:
+            try:
+                # Redis calls block, so they run off the loop every query shares
+                leader = await loop.run_in_executor(None, lambda: self.redis.set(
+                    lease_key, token, nx=True, px=self.lease_ms))
+            except Exception as e:
+                logging.error(f"Single-flight lease unavailable, computing anyway: {e}")
+                return await compute()
+
+            if leader:
+                try:
+                    return await compute()
+                finally:
+                    try:
+                        await loop.run_in_executor(
+                            None, self.redis.eval, RELEASE_LEASE, 1, lease_key, token)
+                    except Exception as e:
+                        logging.error(f"Error releasing single-flight lease: {e}")
+
+            await asyncio.sleep(self.poll_interval)
+            result = await lookup()
+            if result is not None:
+                return result
+            if loop.time() > deadline:
+                logging.warning(f"Gave up waiting for the leader of {key!r}")
+                return await compute()
@@ -0,0 +1,150 @@
+import os
+import re
+import json
+import math
+import logging
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Tuple
+from langchain_core.documents import Document
+
+WORD_PATTERN = re.compile(r"[A-Za-z0-9_]+(?:[-.][A-Za-z0-9_]+)*")
+SUBWORD_PATTERN = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|\d+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into terms, keeping identifiers whole and in parts
+
+    ``build_llama_index`` yields ``build_llama_index``, ``build``, ``llama``
+    and ``index``; ``X-Hub-Signature-256`` and ``getEmbeddings`` are split
+    the same way, so a query may name either the identifier or its words.
+    """
+    terms = []
+    for word in WORD_PATTERN.findall(text):
+        parts = SUBWORD_PATTERN.findall(word)
+        if len(parts) > 1:
+            terms.append(word.lower())
+        terms.extend(part.lower() for part in parts)
+    return terms
+
+
+class BM25Index:
+    """In-process BM25 inverted index over the same chunks as the vector store
+
+    Chunks are keyed by their ``chunk_id`` so the index is updated
+    incrementally alongside the dense one. It is saved as JSON holding each
+    chunk's text, metadata and term counts; postings are rebuilt from the
+    counts on load without re-tokenizing.
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self.version = None
+        self._docs: Dict[str, Dict] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        index = cls(path)
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                index.version = data.get("version")
+                for chunk_id, doc in data["docs"].items():
+                    index._insert(chunk_id, doc)
+            except Exception as e:
+                logging.error(f"Error reading sparse index, starting empty: {e}")
+                index = cls(path)
+        return index
+
+    def save(self, version=None):
+        """Atomically write the index, recording the index version it matches"""
+        with self._lock:
+            self.version = version
+            data = {"version": version, "docs": self._docs}
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, chunk_id: str) -> bool:
+        return chunk_id in self._docs
+
+    def _insert(self, chunk_id: str, doc: Dict):
+        self._docs[chunk_id] = doc
+        self._total_length += doc["length"]
+        for term, count in doc["tf"].items():
+            self._postings.setdefault(term, {})[chunk_id] = count
+
+    def _remove(self, chunk_id: str):
+        doc = self._docs.pop(chunk_id, None)
+        if doc is None:
+            return
+        self._total_length -= doc["length"]
+        for term in doc["tf"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def add(self, chunks: Iterable[Document]):
+        entries = []
+        for chunk in chunks:
+            terms = tokenize(chunk.page_content)
+            entries.append((chunk.metadata["chunk_id"], {
+                "text": chunk.page_content,
+                "metadata": chunk.metadata,
+                "length": len(terms),
+                "tf": dict(Counter(terms))
+            }))
+        with self._lock:
+            for chunk_id, doc in entries:
+                self._remove(chunk_id)
+                self._insert(chunk_id, doc)
+
+    def remove(self, chunk_ids: Iterable[str]):
+        with self._lock:
+            for chunk_id in chunk_ids:
+                self._remove(chunk_id)
+
+    def clear(self):
+        with self._lock:
+            self._docs = {}
+            self._postings = {}
+            self._total_length = 0
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[Document, float]]:
+        terms = set(tokenize(query))
+        with self._lock:
+            count = len(self._docs)
+            if not count or not terms:
+                return []
+            average_length = self._total_length / count
+            scores: Dict[str, float] = {}
+            for term in terms:
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    length = self._docs[chunk_id]["length"]
+                    norm = self.k1 * (1 - self.b + self.b * length / average_length)
+                    scores[chunk_id] = scores.get(chunk_id, 0.0) + \
+                        idf * tf * (self.k1 + 1) / (tf + norm)
+
+            top = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+            return [
+                (Document(page_content=self._docs[chunk_id]["text"],
+                          metadata=self._docs[chunk_id]["metadata"]), score)
+                for chunk_id, score in top
+            ]
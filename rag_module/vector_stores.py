@@ -0,0 +1,247 @@
+"""Vector store backends behind build_vector_store.
+
+VECTOR_STORE_TYPE selects the backend:
+
+* ``chroma`` (default): persistent Chroma collection whose HNSW graph is
+  tuned with the CHROMA_HNSW_* settings.
+* ``faiss``: in-process FAISS index described by a FAISS index-factory
+  string, e.g. ``HNSW32`` (graph), ``HNSW32,SQfp16`` (float16 storage),
+  ``IVF1024,Flat`` or ``IVF1024,PQ32`` (inverted lists, optionally
+  product-quantized), tuned at query time with FAISS_EF_SEARCH/FAISS_NPROBE.
+
+Use ``python -m rag_module.benchmark_index`` to measure recall@k and
+latency of these settings against brute-force search.
+"""
+import os
+import shutil
+import logging
+import threading
+from typing import Any, Dict, Iterable, List, Optional
+from langchain_community.vectorstores import FAISS
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+VECTOR_STORE_TYPE = os.getenv('VECTOR_STORE_TYPE', 'chroma').lower()
+CHROMA_DB_DIR = os.getenv('CHROMA_DB_DIR', './chroma_db')
+CHROMA_HNSW_SPACE = os.getenv('CHROMA_HNSW_SPACE', 'l2')
+CHROMA_HNSW_M = int(os.getenv('CHROMA_HNSW_M', '16'))
+CHROMA_HNSW_CONSTRUCTION_EF = int(os.getenv('CHROMA_HNSW_CONSTRUCTION_EF', '100'))
+CHROMA_HNSW_SEARCH_EF = int(os.getenv('CHROMA_HNSW_SEARCH_EF', '64'))
+FAISS_INDEX_DIR = os.getenv('FAISS_INDEX_DIR', './faiss_index')
+FAISS_INDEX_FACTORY = os.getenv('FAISS_INDEX_FACTORY', 'HNSW32')
+FAISS_EF_CONSTRUCTION = int(os.getenv('FAISS_EF_CONSTRUCTION', '80'))
+FAISS_EF_SEARCH = int(os.getenv('FAISS_EF_SEARCH', '64'))
+FAISS_NPROBE = int(os.getenv('FAISS_NPROBE', '16'))
+
+
+def index_settings() -> Dict[str, Any]:
+    """Backend parameters baked into a built index (changing them rebuilds it)"""
+    if VECTOR_STORE_TYPE == 'faiss':
+        return {
+            "backend": "faiss",
+            "index_factory": FAISS_INDEX_FACTORY,
+            "ef_construction": FAISS_EF_CONSTRUCTION
+        }
+    return {
+        "backend": "chroma",
+        "hnsw": chroma_collection_metadata()
+    }
+
+
+def chroma_collection_metadata() -> Dict[str, Any]:
+    return {
+        "hnsw:space": CHROMA_HNSW_SPACE,
+        "hnsw:M": CHROMA_HNSW_M,
+        "hnsw:construction_ef": CHROMA_HNSW_CONSTRUCTION_EF,
+        "hnsw:search_ef": CHROMA_HNSW_SEARCH_EF
+    }
+
+
+def open_vector_store(embeddings: Embeddings, reset: bool = False):
+    """Open the configured backend's persisted store, or an empty one
+
+    ``reset`` discards whatever is persisted first.
+    """
+    if VECTOR_STORE_TYPE == 'faiss':
+        return FaissVectorStore.open(FAISS_INDEX_DIR, embeddings, reset=reset)
+
+    from langchain_community.vectorstores import Chroma
+
+    if reset:
+        Chroma(
+            persist_directory=CHROMA_DB_DIR,
+            embedding_function=embeddings
+        ).delete_collection()
+    return Chroma(
+        persist_directory=CHROMA_DB_DIR,
+        embedding_function=embeddings,
+        collection_metadata=chroma_collection_metadata()
+    )
+
+
+def count_vectors(vector_store) -> int:
+    if isinstance(vector_store, FaissVectorStore):
+        return vector_store.count()
+    return vector_store._collection.count()
+
+
+def build_faiss_index(dimension: int, factory: str, vectors=None):
+    """Create a FAISS index from a factory string, training it if needed
+
+    Indexes that need training (IVF, PQ) but can't be trained on
+    ``vectors`` (too few of them) fall back to exact search.
+    """
+    import faiss
+
+    index = faiss.index_factory(dimension, factory)
+    hnsw = getattr(faiss.downcast_index(index), "hnsw", None)
+    if hnsw is not None:
+        hnsw.efConstruction = FAISS_EF_CONSTRUCTION
+    if not index.is_trained:
+        try:
+            index.train(vectors)
+        except (RuntimeError, TypeError) as e:
+            logging.warning(
+                f"Can't train FAISS index {factory!r} ({e}); using exact search "
+                f"until the next rebuild")
+            index = faiss.IndexFlatL2(dimension)
+    return index
+
+
+def tune_faiss_index(index, ef_search: int = FAISS_EF_SEARCH,
+                     nprobe: int = FAISS_NPROBE):
+    """Apply query-time parameters that exist for this index type"""
+    import faiss
+
+    params = faiss.ParameterSpace()
+    for name, value in (("efSearch", ef_search), ("nprobe", nprobe)):
+        try:
+            params.set_index_parameter(index, name, value)
+        except RuntimeError:
+            pass  # not an HNSW / IVF index
+
+
+class FaissVectorStore(FAISS):
+    """LangChain FAISS store that supports every index-factory type
+
+    Graph and quantized indexes can't remove vectors and IVF/PQ indexes
+    must be trained before they accept any, so changes those indexes can't
+    apply in place only update the docstore and mark the index stale. It
+    is rebuilt from the docstore before the next search or save; the
+    vectors come back from the embedding cache, so nothing is re-encoded.
+    """
+
+    factory: str = FAISS_INDEX_FACTORY
+    _stale: bool = False
+    # Exact search stands in until there is enough data to train the index
+    _exact_fallback: bool = False
+    _lock: Optional[threading.RLock] = None
+
+    @classmethod
+    def open(cls, directory: str, embeddings: Embeddings,
+             reset: bool = False) -> "FaissVectorStore":
+        import faiss
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+
+        if reset and os.path.exists(directory):
+            shutil.rmtree(directory)
+        if os.path.exists(os.path.join(directory, "index.faiss")):
+            store = cls.load_local(
+                directory, embeddings,
+                # The pickle is our own docstore, written by persist()
+                allow_dangerous_deserialization=True
+            )
+        else:
+            dimension = len(embeddings.embed_query("dimension probe"))
+            store = cls(
+                embeddings,
+                faiss.IndexFlatL2(dimension),
+                InMemoryDocstore(),
+                {}
+            )
+            # Empty: the real index is built (and trained) on the first save
+            store._stale = True
+        store.directory = directory
+        store._lock = threading.RLock()
+        store._exact_fallback = store._is_fallback(store.index)
+        tune_faiss_index(store.index)
+        return store
+
+    def _is_fallback(self, index) -> bool:
+        import faiss
+
+        return (self.factory.replace(" ", "") != "Flat"
+                and isinstance(faiss.downcast_index(index), faiss.IndexFlat))
+
+    def count(self) -> int:
+        return len(self.docstore._dict)
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[dict]] = None,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        with self._lock:
+            if not self._stale and not self._exact_fallback:
+                return super().add_texts(texts, metadatas, ids=ids, **kwargs)
+
+            import uuid
+            ids = ids or [str(uuid.uuid4()) for _ in texts]
+            metadatas = metadatas or [{} for _ in texts]
+            # Embed now so the rebuild finds every vector in the cache
+            self._embed_documents(texts)
+            self.docstore.add({
+                doc_id: Document(page_content=text, metadata=metadata)
+                for doc_id, text, metadata in zip(ids, texts, metadatas)
+            })
+            self._stale = True
+            return ids
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        with self._lock:
+            ids = [doc_id for doc_id in ids or [] if doc_id in self.docstore._dict]
+            if not ids:
+                return True
+            if not self._stale:
+                try:
+                    return super().delete(ids)
+                except RuntimeError:
+                    pass  # remove_ids isn't implemented for this index type
+            self.docstore.delete(ids)
+            self._stale = True
+            return True
+
+    def similarity_search_with_score_by_vector(self, *args: Any, **kwargs: Any):
+        with self._lock:
+            self._rebuild_if_stale()
+            return super().similarity_search_with_score_by_vector(*args, **kwargs)
+
+    def persist(self):
+        with self._lock:
+            self._rebuild_if_stale()
+            os.makedirs(self.directory, exist_ok=True)
+            self.save_local(self.directory)
+
+    def _rebuild_if_stale(self):
+        if not self._stale:
+            return
+        import numpy as np
+
+        ids = list(self.docstore._dict)
+        texts = [self.docstore._dict[doc_id].page_content for doc_id in ids]
+        vectors = np.asarray(self._embed_documents(texts), dtype=np.float32)
+        if len(vectors) == 0:
+            self.index.reset()
+            self.index_to_docstore_id = {}
+            self._stale = False
+            return
+        if self._normalize_L2:
+            import faiss
+            faiss.normalize_L2(vectors)
+
+        index = build_faiss_index(vectors.shape[1], self.factory, vectors)
+        index.add(vectors)
+        tune_faiss_index(index)
+        self._exact_fallback = self._is_fallback(index)
+        self.index = index
+        self.index_to_docstore_id = dict(enumerate(ids))
+        self._stale = False
+        logging.info(f"Rebuilt FAISS index {self.factory!r} with {len(ids)} vectors")